@@ -0,0 +1,329 @@
+#!/usr/bin/env python
+
+from __future__ import division, print_function
+
+"""Benchmarks for the dotting pipeline
+
+Each benchmark runs part of the pipeline over the glyphs of a real font and
+prints timings. Any options after the glyph names are passed on to
+extractpoints.py, e.g.:
+
+    python benchmark.py timeouts Padauk.ttf -- -r 12 -s 6.0
+"""
+
+import argparse
+import json
+import os
+import pickle
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import extractpoints
+import sfntwriter
+
+def setup(fname, argv):
+    """Open a font, and turn the given extractpoints.py command-line options
+    into an Options object. Returns (font, options)."""
+    args = extractpoints.parse_args([fname] + list(argv))
+    font = extractpoints.silent_fontopen(fname)
+    return font, extractpoints.Options.from_args(args)
+
+def glyphs_to_test(font, glyphnames):
+    if glyphnames:
+        return glyphnames
+    return [name for name in font if name not in ('.notdef', '.null')]
+
+def fit_linear(rows, values):
+    """Least-squares fit of values ~ sum(coefficient[i] * row[i]). Returns the
+    list of coefficients. (Solves the normal equations directly, which is
+    fine for the handful of columns we use.)"""
+    n = len(rows[0])
+    # Build the augmented matrix [A^T A | A^T y]
+    matrix = [[sum(row[i] * row[j] for row in rows) for j in range(n)] +
+              [sum(row[i] * y for row, y in zip(rows, values))] for i in range(n)]
+    for col in range(n):
+        pivot = max(range(col, n), key = lambda r: abs(matrix[r][col]))
+        matrix[col], matrix[pivot] = matrix[pivot], matrix[col]
+        if matrix[col][col] == 0:
+            return [0.0] * n
+        for r in range(n):
+            if r != col:
+                factor = matrix[r][col] / matrix[col][col]
+                matrix[r] = [a - factor * b for a, b in zip(matrix[r], matrix[col])]
+    return [matrix[i][n] / matrix[i][i] for i in range(n)]
+
+# How far above the fitted triangulation time the timeout should be
+SAFETY_MARGIN = 10
+
+def benchmark_timeouts(font, glyphnames, options):
+    """Time every triangulation in the given glyphs, then fit the
+    triangulation_timeout model (base + per vertex + per hole) to the times."""
+    timings = []
+    original_make_triangles = extractpoints.make_triangles
+    def timed_make_triangles(polygon_data, holes = None, timeout = None, max_timeout = None, stats = None):
+        holes = holes or []
+        start = time.time()
+        result = original_make_triangles(polygon_data, holes, timeout = 10.0, stats = stats)
+        numvertices = len(polygon_data['line']) + sum(len(hole['line']) for hole in holes)
+        timings.append((numvertices, len(holes), time.time() - start))
+        return result
+    context = extractpoints.RunContext(options, font.em)
+    extractpoints.make_triangles = timed_make_triangles
+    try:
+        for glyphname in glyphnames:
+            glyph = font[glyphname]
+            glyph.unlinkRef()
+            extractpoints.extract_dots(glyph.foreground, context)
+    finally:
+        extractpoints.make_triangles = original_make_triangles
+    if not timings:
+        print("No polygons found")
+        return
+    rows = [(1.0, numvertices, numholes) for numvertices, numholes, seconds in timings]
+    seconds = [t[2] for t in timings]
+    base, per_vertex, per_hole = fit_linear(rows, seconds)
+    print("{} polygons triangulated in {:.2f} seconds (slowest {:.3f} seconds)".format(
+        len(timings), sum(seconds), max(seconds)))
+    print("Fitted model: {:.4f} + {:.6f} * vertices + {:.5f} * holes".format(base, per_vertex, per_hole))
+    worst = max(t[2] / extractpoints.triangulation_timeout(t[0], t[1]) for t in timings)
+    print("Closest call: a polygon took {:.1f}% of its current timeout".format(100.0 * worst))
+    print("Suggested constants (fitted model with a {}x safety margin):".format(SAFETY_MARGIN))
+    print("    TIMEOUT_BASE = {:.4f}".format(max(base, 0.01) * SAFETY_MARGIN))
+    print("    TIMEOUT_PER_VERTEX = {:.6f}".format(max(per_vertex, 0.0) * SAFETY_MARGIN))
+    print("    TIMEOUT_PER_HOLE = {:.5f}".format(max(per_hole, 0.0) * SAFETY_MARGIN))
+    print("Triangulations that timed out even at 10 seconds: {}".format(context.stats['triangulation timeouts']))
+
+def time_glyph(font, glyphname, context):
+    """Process a glyph from scratch; return (seconds, timeouts, dots)"""
+    timeouts_before = context.stats['triangulation timeouts']
+    glyph = font[glyphname]
+    glyph.unlinkRef()
+    start = time.time()
+    dots = extractpoints.extract_dots(glyph.foreground, context)
+    seconds = time.time() - start
+    return seconds, context.stats['triangulation timeouts'] - timeouts_before, len(dots)
+
+def benchmark_repair(font, glyphnames, options):
+    """Process each glyph without and with the outline repair pre-pass.
+    Meant to be run on a list of glyphs known to hang poly2tri."""
+    print("{:<20} {:>28} {:>28}".format("glyph", "without repair", "with repair"))
+    totals = {False: 0.0, True: 0.0}
+    for glyphname in glyphnames:
+        results = []
+        for repair in (False, True):
+            context = extractpoints.RunContext(options._replace(repair = repair), font.em)
+            seconds, timeouts, numdots = time_glyph(font, glyphname, context)
+            totals[repair] += seconds
+            results.append("{:8.3f}s {:3d} timeouts {:4d} dots".format(seconds, timeouts, numdots))
+        print("{:<20} {:>28} {:>28}".format(glyphname, *results))
+    print("{:<20} {:>8.3f}s{:>20} {:>8.3f}s".format("total", totals[False], "", totals[True]))
+
+def benchmark_decimate(font, glyphnames, options):
+    """Process the glyphs at a range of --max-vertices settings, to show the
+    trade-off between time taken and the number of dots (a rough measure of
+    how much of the outline's detail survives)."""
+    print("{:>12} {:>10} {:>12} {:>10}".format("max vertices", "seconds", "removed", "dots"))
+    baseline_dots = None
+    for max_vertices in (None, 2000, 1000, 500, 200, 100):
+        context = extractpoints.RunContext(options._replace(max_vertices = max_vertices), font.em)
+        total_seconds = 0.0
+        total_dots = 0
+        for glyphname in glyphnames:
+            seconds, timeouts, numdots = time_glyph(font, glyphname, context)
+            total_seconds += seconds
+            total_dots += numdots
+        if baseline_dots is None:
+            baseline_dots = total_dots
+        removed = context.stats['vertices removed by decimation']
+        print("{:>12} {:>10.3f} {:>12} {:>10} ({:+.1f}%)".format(
+            max_vertices or "unlimited", total_seconds, removed, total_dots,
+            100.0 * (total_dots - baseline_dots) / max(baseline_dots, 1)))
+
+def benchmark_em(font, glyphnames, options):
+    """Rescale the font to several em sizes and time the glyphs at each, with
+    and without --normalize-em. With normalization, the time should stay
+    about the same whatever the em size."""
+    original_em = font.em
+    normalize_em = options.normalize_em or 1000
+    print("{:>6} {:>18} {:>18}".format("em", "font units", "normalized"))
+    for em in (1000, 2048, 4096):
+        # Changing the em size in FontForge scales every glyph to match
+        font.em = em
+        factor = em / float(original_em)
+        scaled = options._replace(radius = options.radius * factor,
+            minstrokewidth = options.minstrokewidth * factor,
+            maxstrokewidth = options.maxstrokewidth * factor)
+        results = []
+        for normalize in (0, normalize_em):
+            context = extractpoints.RunContext(scaled._replace(normalize_em = normalize), em)
+            total_seconds = 0.0
+            total_dots = 0
+            for glyphname in glyphnames:
+                seconds, timeouts, numdots = time_glyph(font, glyphname, context)
+                total_seconds += seconds
+                total_dots += numdots
+            results.append("{:8.3f}s {:6d} dots".format(total_seconds, total_dots))
+        print("{:>6} {:>18} {:>18}".format(em, *results))
+
+def benchmark_copy(font, glyphnames, options):
+    """Time building the dotted glyphs from their dots, the way copy_glyph
+    used to (a new circle from circle_at for every dot, added to the layer one
+    at a time) and the way it does now (copies of one circle per radius, with
+    the layer set once)."""
+    context = extractpoints.RunContext(options, font.em)
+    dots = {}
+    for glyphname in glyphnames:
+        glyph = font[glyphname]
+        glyph.unlinkRef()
+        dots[glyphname] = extractpoints.extract_dots(glyph.foreground, context)
+    scratch = font.createChar(-1, 'benchmark.scratch')
+    def old_copy(glyph_dots):
+        for dot in glyph_dots:
+            contour = extractpoints.circle_at(dot, size=options.radius)
+            contour.is_quadratic = scratch.foreground.is_quadratic
+            scratch.foreground += contour
+    def new_copy(glyph_dots):
+        extractpoints.copy_glyph(scratch, scratch, options, glyph_dots)
+    print("{} dots in {} glyphs".format(sum(len(d) for d in dots.values()), len(dots)))
+    for name, copy in (("one circle per dot", old_copy), ("template circle", new_copy)):
+        start = time.time()
+        for glyphname in glyphnames:
+            scratch.clear()
+            copy(dots[glyphname])
+        print("{:<20} {:8.3f}s".format(name, time.time() - start))
+    font.removeGlyph(scratch)
+
+# How far (in font units) the bounding boxes of the same glyph written by
+# FontForge and by sfntwriter.py may differ: the circles are made of different
+# curves, and rounded to the grid differently
+WRITER_TOLERANCE = 2
+
+def compare_fonts(fontforge_font, direct_font, glyphnames):
+    """Compare the glyphs of two dotted fonts. Returns a list of problems."""
+    problems = []
+    for glyphname in glyphnames:
+        expected = fontforge_font[glyphname]
+        if glyphname not in direct_font:
+            problems.append("{}: missing".format(glyphname))
+            continue
+        actual = direct_font[glyphname]
+        if expected.width != actual.width:
+            problems.append("{}: width {} instead of {}".format(glyphname, actual.width, expected.width))
+        if len(expected.foreground) != len(actual.foreground):
+            problems.append("{}: {} contours instead of {}".format(glyphname, len(actual.foreground), len(expected.foreground)))
+        elif any(abs(a - b) > WRITER_TOLERANCE for a, b in zip(expected.boundingBox(), actual.boundingBox())):
+            problems.append("{}: bounding box {} instead of {}".format(glyphname, actual.boundingBox(), expected.boundingBox()))
+        if sorted(expected.anchorPoints) != sorted(actual.anchorPoints):
+            problems.append("{}: anchors {} instead of {}".format(glyphname, actual.anchorPoints, expected.anchorPoints))
+    return problems
+
+def benchmark_writer(font, glyphnames, options):
+    """Write the dotted font with FontForge and with sfntwriter.py (--writer
+    direct), time both, and check that the two fonts are equivalent: the
+    same advance widths, anchors and number of dots in every glyph, with
+    bounding boxes within WRITER_TOLERANCE, and every table that the direct
+    writer doesn't rebuild copied from the input unchanged. Needs a TTF."""
+    fname = font.path
+    context = extractpoints.RunContext(options, font.em)
+    cache = {}
+    midlines = {}
+    start = time.time()
+    for glyphname in glyphnames:
+        midlines[glyphname] = extractpoints.glyph_midlines(font[glyphname], context, cache)
+    print("Midlines of {} glyphs in {:.2f}s".format(len(glyphnames), time.time() - start))
+    names = (font.familyname, font.fullname, font.fontname)
+    outputs = {}
+    directory = tempfile.mkdtemp()
+    try:
+        for writer in ('fontforge', 'direct'):
+            outputs[writer] = os.path.join(directory, writer + '.ttf')
+            start = time.time()
+            extractpoints.write_dotted_font(fname, font, outputs[writer], options._replace(writer = writer),
+                names, None, glyphnames, midlines)
+            print("{:<10} {:8.3f}s {:>10} bytes".format(writer, time.time() - start, os.path.getsize(outputs[writer])))
+        fontforge_font = extractpoints.silent_fontopen(outputs['fontforge'])
+        direct_font = extractpoints.silent_fontopen(outputs['direct'])
+        problems = compare_fonts(fontforge_font, direct_font, glyphnames)
+        fontforge_font.close()
+        direct_font.close()
+        version, input_tables = sfntwriter.read_sfnt(fname)
+        version, output_tables = sfntwriter.read_sfnt(outputs['direct'])
+        for tag in sorted(input_tables):
+            if tag in sfntwriter.REBUILT_TABLES or tag in sfntwriter.DROPPED_TABLES:
+                continue
+            if output_tables.get(tag) != input_tables[tag]:
+                problems.append("table {} wasn't copied unchanged".format(tag))
+    finally:
+        shutil.rmtree(directory)
+    for problem in problems:
+        print("MISMATCH", problem)
+    print("{} glyphs compared, {} mismatches".format(len(glyphnames), len(problems)))
+
+# Runs dot_font in a fresh process (so that its peak memory is its own), with
+# the arguments pickled on stdin, and writes its statistics to a JSON file
+DOT_FONT_CHILD = """
+import json, pickle, sys
+sys.path.insert(0, {!r})
+import extractpoints
+fname, output, options, stats_file = pickle.load(sys.stdin)
+with open(stats_file, 'w') as f:
+    json.dump(extractpoints.dot_font(fname, output, options), f)
+""".format(os.path.dirname(os.path.abspath(extractpoints.__file__)))
+
+def benchmark_inplace(font, glyphnames, options):
+    """Dot the glyphs with and without --in-place, each run in a process of
+    its own, and compare the time spent opening fonts, the total time and
+    the peak memory"""
+    directory = tempfile.mkdtemp()
+    options = options._replace(glyphs = ",".join(glyphnames), font_name = font.familyname + " Dotted",
+        resume = False, stats = None)
+    results = []
+    try:
+        for in_place in (False, True):
+            output = os.path.join(directory, 'output.ttf')
+            stats_file = os.path.join(directory, 'stats.json')
+            start = time.time()
+            child = subprocess.Popen([sys.executable, '-c', DOT_FONT_CHILD], stdin = subprocess.PIPE)
+            child.communicate(pickle.dumps((font.path, output, options._replace(in_place = in_place), stats_file)))
+            if child.returncode != 0:
+                print("Run failed with exit code", child.returncode)
+                return
+            with open(stats_file) as f:
+                stats = json.load(f)
+            results.append((in_place, time.time() - start, stats))
+    finally:
+        shutil.rmtree(directory)
+    print("{:<10} {:>14} {:>12} {:>12}".format("mode", "opening fonts", "total", "peak memory"))
+    for in_place, seconds, stats in results:
+        print("{:<10} {:>13.2f}s {:>11.2f}s {:>9.1f} MB".format("in place" if in_place else "copy",
+            stats.get('opening fonts (seconds)', 0.0), seconds, stats.get('peak memory (MB)', 0.0)))
+
+BENCHMARKS = {
+    'timeouts': benchmark_timeouts,
+    'repair': benchmark_repair,
+    'decimate': benchmark_decimate,
+    'em': benchmark_em,
+    'copy': benchmark_copy,
+    'writer': benchmark_writer,
+    'inplace': benchmark_inplace,
+}
+
+def main():
+    parser = argparse.ArgumentParser(description = "Benchmarks for the dotting pipeline")
+    parser.add_argument("benchmark", choices = sorted(BENCHMARKS), help = "Which benchmark to run")
+    parser.add_argument("inputfilename", help = "Font file (SFD or TTF format)")
+    parser.add_argument("glyphnames", nargs = "*", help = "Glyphs to test (default: all glyphs)")
+    argv = sys.argv[1:]
+    extractpoints_argv = []
+    if '--' in argv:
+        extractpoints_argv = argv[argv.index('--') + 1:]
+        argv = argv[:argv.index('--')]
+    args = parser.parse_args(argv)
+    font, options = setup(args.inputfilename, extractpoints_argv)
+    BENCHMARKS[args.benchmark](font, glyphs_to_test(font, args.glyphnames), options)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,222 @@
+from __future__ import division, print_function
+
+"""Library for cleaning up flattened outlines before triangulation
+
+poly2tri expects simple polygons: no repeated points, no edges that double back
+on themselves, no ring that touches itself, and no hole that touches the
+outside of the polygon. Badly-designed fonts break all of those rules, and
+when they do, cdt.triangulate() can go into an infinite loop. The functions
+here fix those problems in the flattened rings (lists of (x, y) tuples), so
+that such glyphs triangulate normally instead of timing out.
+
+decimate_ring caps the number of points in a ring, since triangulation and
+everything after it get slower with every point.
+
+All functions take and return open rings (without the first point repeated
+at the end); repair_polygon deals with closed rings.
+"""
+
+import collections
+import math
+import sys
+from shapely.geometry import LinearRing, Point
+from generalfuncs import ux, uy, vectorlength, are_points_equal, remove_near_duplicates
+
+def remove_spikes(ring, epsilon = 0.5):
+    """Remove zero-length edges, and points where the ring doubles straight
+    back on itself (a spike of zero width). Returns (ring, number removed)."""
+    ring = list(ring)
+    removed = 0
+    changed = True
+    while changed and len(ring) >= 3:
+        changed = False
+        result = []
+        n = len(ring)
+        i = 0
+        while i < n:
+            a = result[-1] if result else ring[i - 1]
+            b = ring[i]
+            c = ring[(i + 1) % n]
+            abx, aby = ux(b) - ux(a), uy(b) - uy(a)
+            bcx, bcy = ux(c) - ux(b), uy(c) - uy(b)
+            cross = abx * bcy - aby * bcx
+            dot = abx * bcx + aby * bcy
+            length = max(math.hypot(abx, aby), math.hypot(bcx, bcy), epsilon)
+            if vectorlength(a, b) < epsilon or (abs(cross) / length < epsilon and dot < 0):
+                # Skip b: it's either on top of a, or the tip of a spike
+                removed += 1
+                changed = True
+            else:
+                result.append(b)
+            i += 1
+        ring = result
+    return ring, removed
+
+def separate_touching_points(ring, epsilon = 0.5):
+    """Find points of the ring that touch an earlier, non-adjacent point of the
+    same ring (a "pinched" ring), and move each one a little way towards the
+    middle of its two neighbours so the ring no longer touches itself.
+    Returns (ring, number moved)."""
+    ring = list(ring)
+    n = len(ring)
+    # Spatial hash with cells of size epsilon: touching points are in the same
+    # or a neighbouring cell
+    cells = collections.defaultdict(list)
+    def cell(p):
+        return (int(math.floor(ux(p) / epsilon)), int(math.floor(uy(p) / epsilon)))
+    moved = 0
+    for i, p in enumerate(ring):
+        cx, cy = cell(p)
+        touching = False
+        for dx in (-1, 0, 1):
+            for dy in (-1, 0, 1):
+                for j in cells[(cx + dx, cy + dy)]:
+                    if abs(i - j) > 1 and abs(i - j) < n - 1 and vectorlength(ring[j], p) < epsilon:
+                        touching = True
+        if touching:
+            before, after = ring[i - 1], ring[(i + 1) % n]
+            mx = (ux(before) + ux(after)) / 2.0
+            my = (uy(before) + uy(after)) / 2.0
+            distance = math.hypot(mx - ux(p), my - uy(p))
+            if distance > 0:
+                step = min(2 * epsilon, distance / 2.0) / distance
+                p = (ux(p) + (mx - ux(p)) * step, uy(p) + (my - uy(p)) * step)
+                ring[i] = p
+                moved += 1
+        cells[cell(p)].append(i)
+    return ring, moved
+
+def snap_hole_away(hole, others, epsilon = 0.5):
+    """Move any point of a hole that is within epsilon of one of the other
+    rings (the outside of the polygon, or another hole) towards the center of
+    the hole, so that they no longer touch. Returns (hole, number moved)."""
+    hole = list(hole)
+    if len(hole) < 3:
+        return hole, 0
+    hole_ring = LinearRing(hole)
+    close_rings = [LinearRing(other) for other in others if len(other) >= 3]
+    # Cheap test first: most holes are nowhere near anything else
+    close_rings = [other for other in close_rings if other.distance(hole_ring) < epsilon]
+    if not close_rings:
+        return hole, 0
+    cx = sum(ux(p) for p in hole) / len(hole)
+    cy = sum(uy(p) for p in hole) / len(hole)
+    moved = 0
+    for i, p in enumerate(hole):
+        point = Point(ux(p), uy(p))
+        if any(other.distance(point) < epsilon for other in close_rings):
+            distance = math.hypot(cx - ux(p), cy - uy(p))
+            if distance > 0:
+                step = min(2 * epsilon, distance / 2.0) / distance
+                hole[i] = (ux(p) + (cx - ux(p)) * step, uy(p) + (cy - uy(p)) * step)
+                moved += 1
+    return hole, moved
+
+def decimate_ring(ring, tolerance, max_edge, max_vertices = None):
+    """Drop points from an open ring where the outline is nearly straight. A
+    run of points is replaced by a single edge if none of them is further than
+    tolerance from that edge and the edge is no longer than max_edge, so that
+    edges stay short enough for the triangulation to work well. If
+    max_vertices is given and the ring is still too big, tolerance and
+    max_edge are doubled until it fits; as a last resort, points are dropped
+    evenly all the way around. Returns the decimated ring."""
+    result = _decimate_once(ring, tolerance, max_edge)
+    if max_vertices is None:
+        return result
+    max_vertices = max(max_vertices, 3)
+    for attempt in range(8):
+        if len(result) <= max_vertices:
+            return result
+        tolerance = max(tolerance * 2, 1e-6)
+        max_edge *= 2
+        result = _decimate_once(result, tolerance, max_edge)
+    if len(result) > max_vertices:
+        step = len(result) / float(max_vertices)
+        result = [result[int(i * step)] for i in range(max_vertices)]
+    return result
+
+def _decimate_once(ring, tolerance, max_edge):
+    ring = list(ring)
+    n = len(ring)
+    if n <= 3:
+        return ring
+    result = [ring[0]]
+    i = 0
+    while i < n - 1:
+        # Extend the edge from point i for as long as the points it skips
+        # over stay within tolerance of it
+        j = i + 1
+        while j + 1 < n:
+            candidate = ring[j + 1]
+            if vectorlength(ring[i], candidate) > max_edge:
+                break
+            if any(distance_to_segment(ring[k], ring[i], candidate) > tolerance for k in range(i + 1, j + 1)):
+                break
+            j += 1
+        result.append(ring[j])
+        i = j
+    return result
+
+def distance_to_segment(p, a, b):
+    """Distance from point p to the line segment from a to b"""
+    ax, ay, bx, by = ux(a), uy(a), ux(b), uy(b)
+    dx, dy = bx - ax, by - ay
+    length_squared = dx * dx + dy * dy
+    if length_squared == 0:
+        return vectorlength(p, a)
+    t = ((ux(p) - ax) * dx + (uy(p) - ay) * dy) / length_squared
+    t = max(0.0, min(1.0, t))
+    return math.hypot(ux(p) - (ax + t * dx), uy(p) - (ay + t * dy))
+
+def open_ring(line):
+    line = [(ux(p), uy(p)) for p in line]
+    if len(line) > 1 and are_points_equal(line[0], line[-1]):
+        del line[-1]
+    return line
+
+def close_ring(ring):
+    if ring:
+        return ring + [ring[0]]
+    return ring
+
+def repair_ring(ring, epsilon = 0.5):
+    """Apply all single-ring repairs to an open ring. Returns (ring, stats)
+    where stats is a Counter of the repairs made."""
+    stats = collections.Counter()
+    count = len(ring)
+    ring = remove_near_duplicates(ring, epsilon)
+    stats['near-duplicate vertices merged'] += count - len(ring)
+    ring, removed = remove_spikes(ring, epsilon)
+    stats['spike vertices removed'] += removed
+    ring, moved = separate_touching_points(ring, epsilon)
+    stats['self-touching vertices moved'] += moved
+    return ring, stats
+
+def repair_polygon(outline, holes, epsilon = 0.5):
+    """Repair a polygon's outside ring and its holes, given as closed
+    polylines. Returns (outline, holes, stats): the repaired closed polylines,
+    with None in place of any hole that collapsed to fewer than three points,
+    and a Counter of the repairs made."""
+    stats = collections.Counter()
+    outline, ring_stats = repair_ring(open_ring(outline), epsilon)
+    stats.update(ring_stats)
+    repaired_holes = []
+    for hole in holes:
+        hole, ring_stats = repair_ring(open_ring(hole), epsilon)
+        stats.update(ring_stats)
+        if len(hole) < 3:
+            stats['degenerate holes dropped'] += 1
+            hole = None
+        repaired_holes.append(hole)
+    for i, hole in enumerate(repaired_holes):
+        if hole is None:
+            continue
+        others = [outline] + [other for j, other in enumerate(repaired_holes) if j != i and other is not None]
+        repaired_holes[i], moved = snap_hole_away(hole, others, epsilon)
+        stats['hole vertices moved off other rings'] += moved
+    stats = collections.Counter(dict((name, n) for name, n in stats.items() if n))
+    repaired_holes = [close_ring(hole) if hole is not None else None for hole in repaired_holes]
+    return close_ring(outline), repaired_holes, stats
+
+if __name__ == '__main__':
+    sys.stderr.write('Please run extractpoints.py, not this file.\n')
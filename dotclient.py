@@ -0,0 +1,98 @@
+#!/usr/bin/env python
+
+from __future__ import division, print_function
+
+"""Load-test client for dotserver.py
+
+Sends requests for the dots of a list of glyphs to a running dotserver.py,
+from several threads at once, and prints the latency percentiles, e.g.:
+
+    python dotclient.py Padauk --glyphs U+1000,U+1001,U+1002 -n 500 -c 4
+
+Only needs the Python standard library, so it can run anywhere.
+"""
+
+import argparse
+import httplib
+import json
+import math
+import sys
+import threading
+import time
+import urllib
+
+def percentile(sorted_values, fraction):
+    """The value below which the given fraction of the (sorted) values fall,
+    using the nearest-rank method"""
+    if not sorted_values:
+        return float('nan')
+    rank = int(math.ceil(fraction * len(sorted_values)))
+    return sorted_values[max(rank, 1) - 1]
+
+def run_client(host, port, paths, count, latencies, errors):
+    """Send count requests, cycling through paths, over one kept-alive
+    connection. Appends each request's seconds to latencies."""
+    connection = httplib.HTTPConnection(host, port)
+    for i in range(count):
+        path = paths[i % len(paths)]
+        start = time.time()
+        try:
+            connection.request("GET", path)
+            response = connection.getresponse()
+            body = response.read()
+        except (httplib.HTTPException, IOError) as e:
+            errors.append(str(e))
+            connection.close()
+            connection = httplib.HTTPConnection(host, port)
+            continue
+        latencies.append(time.time() - start)
+        if response.status != 200:
+            errors.append(json.loads(body).get('error', body))
+    connection.close()
+
+def main():
+    parser = argparse.ArgumentParser(description = "Load-test a running dotserver.py")
+    parser.add_argument("font", help = "Font name, as served by dotserver.py")
+    parser.add_argument('--glyphs', action = "store", default = "U+0041", help = "Comma-separated glyph names or U+89AB codepoints to request, in turn (default U+0041)")
+    parser.add_argument('--host', action = "store", default = "127.0.0.1", help = "Server address (default 127.0.0.1)")
+    parser.add_argument('-p', '--port', action = "store", type = int, default = 8037, help = "Server port (default 8037)")
+    parser.add_argument('-n', '--requests', action = "store", type = int, default = 200, help = "Total number of requests (default 200)")
+    parser.add_argument('-c', '--concurrency', action = "store", type = int, default = 1, help = "Number of clients sending requests at once (default 1)")
+    parser.add_argument('-r', '--radius', action = "store", type = float, default = None, help = "Radius to ask for (default: the server's)")
+    parser.add_argument('-s', '--spacing', action = "store", type = float, default = None, help = "Spacing to ask for (default: the server's)")
+    args = parser.parse_args()
+    paths = []
+    for glyph in args.glyphs.split(','):
+        params = [('font', args.font), ('glyph', glyph.strip())]
+        if args.radius is not None:
+            params.append(('radius', args.radius))
+        if args.spacing is not None:
+            params.append(('spacing', args.spacing))
+        paths.append("/dots?" + urllib.urlencode(params))
+    latencies = []
+    errors = []
+    clients = max(args.concurrency, 1)
+    threads = []
+    start = time.time()
+    for i in range(clients):
+        # Share the requests out as evenly as possible
+        count = args.requests // clients + (1 if i < args.requests % clients else 0)
+        thread = threading.Thread(target = run_client, args = (args.host, args.port, paths, count, latencies, errors))
+        thread.start()
+        threads.append(thread)
+    for thread in threads:
+        thread.join()
+    elapsed = time.time() - start
+    latencies.sort()
+    print("{} requests in {:.2f} seconds ({:.1f} per second), {} errors".format(
+        len(latencies), elapsed, len(latencies) / max(elapsed, 1e-9), len(errors)))
+    if latencies:
+        print("Latency: p50 {:.1f} ms, p90 {:.1f} ms, p99 {:.1f} ms, max {:.1f} ms".format(
+            1000 * percentile(latencies, 0.5), 1000 * percentile(latencies, 0.9),
+            1000 * percentile(latencies, 0.99), 1000 * latencies[-1]))
+    for error in sorted(set(errors))[:5]:
+        print("Error:", error)
+    return 1 if errors else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,257 @@
+#!/usr/bin/env python
+
+from __future__ import division, print_function
+
+"""Local HTTP server that answers requests for the dots of single glyphs
+
+Running extractpoints.py for each glyph means starting Python, loading
+FontForge and shapely, opening the font and starting a triangulation worker
+every time. This server does all that once, and then answers requests like
+
+    http://127.0.0.1:8037/dots?font=Padauk&glyph=U+1000&radius=12&spacing=6
+    http://127.0.0.1:8037/dots?font=Padauk&text=abc
+
+with JSON: {"font": ..., "options": {...}, "seconds": ...,
+"glyphs": [{"glyph": name, "width": advance, "dots": [[x, y], ...]}, ...]}.
+Dots are in font units. Any setting that isn't given comes from the server's
+own command line (see --help). GET /fonts lists the fonts being served.
+
+The server only listens on 127.0.0.1 and needs no network access. Each
+connection gets a thread of its own, but FontForge isn't thread-safe, so all
+the dotting is done by a single thread (which also keeps one triangulation
+worker warm) and requests wait their turn for it. The midlines of each glyph
+are only calculated once, and placing dots on them for another radius or
+spacing is cheap. Use dotclient.py to measure the latency.
+"""
+
+import argparse
+import collections
+import json
+import os
+import sys
+import threading
+import time
+import urlparse
+import Queue
+import BaseHTTPServer
+import SocketServer
+import extractpoints
+from generalfuncs import ux, uy
+
+# Settings that may be given in a request, and how to parse them
+REQUEST_OPTIONS = {
+    'radius': float,
+    'spacing': float,
+    'prune_distance': float,
+    'minstrokewidth': float,
+    'maxstrokewidth': float,
+    'glyph_budget': float,
+    'max_vertices': int,
+    'decimate_tolerance': float,
+}
+
+class RequestError(Exception):
+    """A bad request; status is the HTTP status code to answer with"""
+    def __init__(self, status, message):
+        super(RequestError, self).__init__(message)
+        self.status = status
+
+class DotService(object):
+    """The fonts being served, and the dots already calculated for them.
+    Fonts are opened once and reopened only if their file changes. For each
+    font and set of options there's a midline cache and an outline cache (see
+    glyph_midlines); the least recently used sets are dropped beyond
+    max_cached. The radius, spacing and pruning don't affect the midlines, so
+    requests that only differ in those share caches."""
+    def __init__(self, fontfiles, options, max_cached = 32):
+        self.options = options
+        self.max_cached = max_cached
+        self.paths = collections.OrderedDict()
+        for fname in fontfiles:
+            name = os.path.splitext(os.path.basename(fname))[0]
+            self.paths[name] = os.path.abspath(fname)
+        self.fonts = {}
+        self.caches = collections.OrderedDict()
+        self.requests = Queue.Queue()
+
+    def start(self):
+        """Start the thread that does all the work, and have it open every
+        font and start the triangulation worker, so that the first request
+        doesn't have to wait for them"""
+        thread = threading.Thread(target = self.run)
+        thread.daemon = True
+        thread.start()
+        for name in self.paths:
+            self.call(self.font, name)
+        self.call(extractpoints.get_triangulation_worker)
+
+    def run(self):
+        while True:
+            function, args, answer = self.requests.get()
+            try:
+                answer.put((True, function(*args)))
+            except Exception as e:
+                answer.put((False, e))
+
+    def call(self, function, *args):
+        """Run function(*args) on the service's thread, and return its result
+        or raise its exception"""
+        answer = Queue.Queue(1)
+        self.requests.put((function, args, answer))
+        ok, result = answer.get()
+        if not ok:
+            raise result
+        return result
+
+    def font(self, name):
+        """Return the font called name, opening or reopening it if needed"""
+        if name not in self.paths:
+            raise RequestError(404, "Unknown font {!r}; this server has: {}".format(name, ", ".join(self.paths)))
+        path = self.paths[name]
+        mtime = os.stat(path).st_mtime
+        if name not in self.fonts or self.fonts[name][1] != mtime:
+            if name in self.fonts:
+                self.fonts[name][0].close()
+            self.fonts[name] = (extractpoints.silent_fontopen(path), mtime)
+            # Dots calculated from the old file are no good any more
+            for key in [key for key in self.caches if key[0] == name]:
+                del self.caches[key]
+        return self.fonts[name][0]
+
+    def caches_for(self, name, options):
+        key = (name, options._replace(radius = None, spacing = None, prune_distance = None))
+        if key in self.caches:
+            caches = self.caches.pop(key)
+        else:
+            caches = ({}, {})
+            while len(self.caches) >= self.max_cached:
+                self.caches.popitem(last = False)
+        self.caches[key] = caches
+        return caches
+
+    def request_options(self, params):
+        """Apply the settings given in a request to the server's options"""
+        changes = {}
+        for name, value in params.items():
+            if name in REQUEST_OPTIONS:
+                try:
+                    changes[name] = REQUEST_OPTIONS[name](value)
+                except ValueError:
+                    raise RequestError(400, "Bad value for {}: {!r}".format(name, value))
+        return self.options._replace(**changes)
+
+    def dots(self, params):
+        """Answer a /dots request, given its query parameters as a dict"""
+        start = time.time()
+        if 'font' not in params:
+            raise RequestError(400, "No font given")
+        font = self.font(params['font'])
+        options = self.request_options(params)
+        if 'glyph' in params:
+            glyphs = [find_glyph(font, params['glyph'])]
+        elif 'text' in params:
+            glyphs = [find_glyph(font, ord(c)) for c in params['text'].decode('utf-8')]
+        else:
+            raise RequestError(400, "Give either glyph or text")
+        context = extractpoints.RunContext(options, font.em)
+        midline_cache, outline_cache = self.caches_for(params['font'], options)
+        results = []
+        for glyph in glyphs:
+            dots = extractpoints.glyph_dots(glyph, context, midline_cache, False, outline_cache)
+            results.append({
+                'glyph': glyph.glyphname,
+                'width': glyph.width,
+                'dots': [[ux(dot), uy(dot)] for dot in dots],
+            })
+        return {
+            'font': params['font'],
+            'options': dict((name, getattr(options, name)) for name in sorted(REQUEST_OPTIONS)),
+            'glyphs': results,
+            'seconds': time.time() - start,
+        }
+
+    def fonts_list(self):
+        return {'fonts': list(self.paths)}
+
+def find_glyph(font, spec):
+    """Find a glyph by name, by "U+89AB" codepoint, or by integer codepoint"""
+    # (An unescaped "+" in a URL arrives as a space)
+    if isinstance(spec, basestring) and spec.upper()[:2] in ('U+', 'U '):
+        try:
+            spec = int(spec[2:], 16)
+        except ValueError:
+            raise RequestError(400, "Bad codepoint {!r}".format(spec))
+    try:
+        return font[spec]
+    except (TypeError, KeyError):
+        if isinstance(spec, int):
+            raise RequestError(404, "No glyph for U+{:04X} in this font".format(spec))
+        raise RequestError(404, "No glyph named {!r} in this font".format(spec))
+
+class DotRequestHandler(BaseHTTPServer.BaseHTTPRequestHandler):
+    # Keep connections open, so that clients don't pay for a new one each time
+    protocol_version = "HTTP/1.1"
+    # Send the response as soon as it's written, instead of waiting on the
+    # client's acknowledgement of the headers
+    disable_nagle_algorithm = True
+
+    def do_GET(self):
+        url = urlparse.urlparse(self.path)
+        params = dict(urlparse.parse_qsl(url.query))
+        try:
+            if url.path == '/dots':
+                service = self.server.service
+                self.answer(200, service.call(service.dots, params))
+            elif url.path == '/fonts':
+                self.answer(200, self.server.service.fonts_list())
+            else:
+                raise RequestError(404, "Unknown path {}".format(url.path))
+        except RequestError as e:
+            self.answer(e.status, {'error': str(e)})
+        except Exception as e:
+            self.answer(500, {'error': "{}: {}".format(e.__class__.__name__, e)})
+
+    def answer(self, status, data):
+        body = json.dumps(data, separators = (',', ':'))
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        if self.server.verbose:
+            BaseHTTPServer.BaseHTTPRequestHandler.log_message(self, format, *args)
+
+class DotServer(SocketServer.ThreadingMixIn, BaseHTTPServer.HTTPServer):
+    daemon_threads = True
+
+def parse_args(argv = None):
+    parser = argparse.ArgumentParser(description = "Serve the dots of single glyphs over HTTP on 127.0.0.1")
+    parser.add_argument("fontfiles", nargs = "+", help = "Font files (SFD or TTF format) to serve; requests name them by file name without the extension")
+    parser.add_argument('-p', '--port', action = "store", type = int, default = 8037, help = "Port to listen on (default 8037)")
+    parser.add_argument('-v', '--verbose', action = "store_true", help = "Log every request")
+    parser.add_argument('-r', '--radius', action = "store", type = float, default = 12, help = "Default radius of dots, in em units (default 12)")
+    parser.add_argument('-s', '--spacing', action = "store", type = float, default = 6.0, help = "Default spacing of dots, as a multiple of dot radius (default 6.0)")
+    parser.add_argument('--glyph-budget', action = "store", type = float, default = None, metavar = "SECONDS", help = "Time allowed per glyph (see extractpoints.py --help)")
+    return parser.parse_args(argv)
+
+def main():
+    args = parse_args()
+    options = extractpoints.Options(radius = args.radius, spacing = args.spacing, glyph_budget = args.glyph_budget)
+    service = DotService(args.fontfiles, options)
+    service.start()
+    server = DotServer(('127.0.0.1', args.port), DotRequestHandler)
+    server.service = service
+    server.verbose = args.verbose
+    print("Serving {} on http://127.0.0.1:{}/".format(", ".join(service.paths), args.port))
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
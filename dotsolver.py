@@ -0,0 +1,117 @@
+from __future__ import division, print_function
+
+"""Library for choosing the dot spacing that meets a target
+
+Instead of trying different -s values in full runs until the dots look right,
+a target can be given and the spacing searched for. Only the last step of the
+pipeline, placing dots along the midlines, depends on the spacing, so the
+search works on the midlines of a finished run and is cheap. The targets are:
+
+    dots     average number of dots per glyph (over glyphs that have any)
+    density  dots per em of midline length
+    gap      space between neighbouring dots on a midline, in font units;
+             0 means the dots just touch, less than 0 that they overlap
+
+The dot count only changes in steps as the spacing changes, so the spacing
+found gives the closest result to the target that is possible, which may not
+be exactly the target. Dots dropped afterwards for being too close to another
+(see --prune-distance) aren't taken into account.
+"""
+
+import math
+import sys
+from generalfuncs import pairwise, vectorlength
+
+TARGETS = ('dots', 'density', 'gap')
+
+# Range of spacings (as multiples of the dot radius) to search
+MIN_SPACING = 0.25
+MAX_SPACING = 100.0
+ITERATIONS = 40
+
+def midline_lengths(midlines):
+    """The length of each midline (a list of (x, y) points)"""
+    return [sum(vectorlength(a, b) for a, b in pairwise(line)) for line in midlines]
+
+def dots_on_line(length, unit_spacing):
+    """How many dots extractpoints.calculate_dots places on a midline of the
+    given length, without placing them. Returns (dots, distance between
+    neighbouring dots). (Whether the last dot lands exactly on the end of the
+    line is down to rounding, so the real count is occasionally one off.)"""
+    if length <= 0.0:
+        return 1, 0.0
+    numdots = max(math.floor(length / float(unit_spacing)), 1.0)
+    line_spacing = length / float(numdots)
+    # Count the same way calculate_dots does
+    count = 0
+    distance = 0.0
+    while distance <= length:
+        count += 1
+        distance += line_spacing
+    return count, line_spacing
+
+def measure(target, lengths, radius, spacing, em):
+    """Measure a target (one of TARGETS) for a group of glyphs, given as a
+    list of lists of midline lengths (one list per glyph), with the given
+    radius and spacing."""
+    unit_spacing = spacing * radius
+    total_dots = 0
+    gaps = 0.0
+    pairs = 0
+    for glyph_lengths in lengths:
+        for length in glyph_lengths:
+            count, line_spacing = dots_on_line(length, unit_spacing)
+            total_dots += count
+            gaps += (count - 1) * (line_spacing - 2 * radius)
+            pairs += count - 1
+    if target == 'dots':
+        return total_dots / float(len(lengths))
+    elif target == 'density':
+        total_length = sum(sum(glyph_lengths) for glyph_lengths in lengths)
+        return total_dots / (total_length / float(em)) if total_length else 0.0
+    elif target == 'gap':
+        return gaps / pairs if pairs else 0.0
+    raise ValueError("Unknown target {!r}".format(target))
+
+def solve_spacing(target, value, lengths, radius, em):
+    """Search for the spacing at which a target (one of TARGETS) measures as
+    close as possible to value, for a group of glyphs given as in measure.
+    Returns (spacing, measured value)."""
+    # More spacing means fewer dots, but a bigger gap between them
+    increasing = (target == 'gap')
+    low, high = MIN_SPACING, MAX_SPACING
+    best = None
+    for i in range(ITERATIONS):
+        spacing = (low + high) / 2.0
+        achieved = measure(target, lengths, radius, spacing, em)
+        if best is None or abs(achieved - value) < abs(best[1] - value):
+            best = (spacing, achieved)
+        if achieved == value:
+            break
+        if (achieved > value) == increasing:
+            high = spacing
+        else:
+            low = spacing
+    return best
+
+def solve_font(target, value, midlines, radius, em):
+    """Find the one spacing for all glyphs that meets the target best.
+    midlines is a dict of glyph name -> midlines. Returns (spacing, measured
+    value), or None if no glyph has any midlines."""
+    lengths = [midline_lengths(lines) for lines in midlines.values() if lines]
+    if not lengths:
+        return None
+    return solve_spacing(target, value, lengths, radius, em)
+
+def solve_glyphs(target, value, midlines, radius, em):
+    """Find the spacing for each glyph that meets the target best. Returns a
+    dict of glyph name -> (spacing, measured value), leaving out glyphs that
+    have no midlines."""
+    result = {}
+    for glyphname, lines in midlines.items():
+        if lines:
+            result[glyphname] = solve_spacing(target, value, [midline_lengths(lines)], radius, em)
+    return result
+
+if __name__ == '__main__':
+    sys.stderr.write('Please run extractpoints.py, not this file.\n')
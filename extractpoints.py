@@ -18,6 +18,17 @@ warnings.filterwarnings("ignore", "The _posixsubprocess module is not being used
 import subprocess32
 import math
 import shutil
+import signal
+import select
+import atexit
+try:
+    import resource
+except ImportError:
+    # Not on Windows; peak memory isn't reported there
+    resource = None
+import multiprocessing
+import threading
+import tempfile
 import textwrap
 from shapely.geometry import Polygon, LineString, Point
 
@@ -36,7 +47,118 @@ from generalfuncs import (
     comp, iterfilter_stopatvectors, itermap_stopatvectors,
     AttrDict, closer, closerish, further, angle, similar_direction, shallow_angle,
     center_of_triangle, circle_at, scale_by, debug_dump,
+    remove_near_duplicates, jitter_polyline, prune_close_dots,
 )
+from journal import GlyphJournal
+from cleanup import repair_polygon, decimate_ring, open_ring, close_ring
+from scheduler import (
+    estimate_costs, largest_first, predict_makespan, load_glyph_stats, save_glyph_stats,
+)
+from dotsolver import TARGETS, solve_font, solve_glyphs
+from sfntwriter import UnsupportedFont, write_dotted_ttf
+import stagefile
+from ufowriter import MANIFEST_NAME, load_manifest, write_dotted_glyphs
+
+# ==============
+# This section is for the settings and per-run state that the pipeline is given
+# ==============
+
+# Every setting of the pipeline, with its default. The command-line options
+# (see parse_args) have the same names.
+DEFAULT_OPTIONS = collections.OrderedDict([
+    ('radius', 12.0),
+    ('spacing', 6.0),
+    ('target_dots', None),
+    ('target_density', None),
+    ('target_gap', None),
+    ('target_per_glyph', False),
+    ('prune_distance', 0.5),
+    ('scale', 1.0),
+    ('minstrokewidth', 1.0),
+    ('maxstrokewidth', 1e100),
+    ('copy_bearings', False),
+    ('font_name', ""),
+    ('writer', 'fontforge'),
+    ('in_place', False),
+    ('normalize_em', 1000),
+    ('repair', True),
+    ('repair_epsilon', 0.5),
+    ('max_vertices', None),
+    ('decimate_tolerance', None),
+    ('max_edge_factor', 2.0),
+    ('glyph_budget', None),
+    ('text', None),
+    ('unicodes', None),
+    ('glyphs', None),
+    ('jobs', 1),
+    ('world_jobs', 1),
+    ('stats', None),
+    ('resume', False),
+    ('checkpoint_every', 50),
+    ('show_triangles', False),
+    ('show_lines', False),
+    ('show_dots', False),
+    ('show_glyph', False),
+    ('zoom', 1.0),
+    ('contact_sheet', None),
+    ('save_stages', None),
+])
+
+class Options(collections.namedtuple('Options', DEFAULT_OPTIONS.keys())):
+    """Immutable settings for the pipeline. Settings that aren't given get
+    their defaults from DEFAULT_OPTIONS, and _replace() makes a changed copy:
+
+        options = Options(radius = 10, spacing = 4.0)
+        bigger_dots = options._replace(radius = 15)
+
+    Options can be shared between threads and sent to worker processes."""
+    __slots__ = ()
+
+    def __new__(cls, *values, **kwargs):
+        unknown = set(kwargs) - set(cls._fields)
+        if unknown:
+            raise TypeError("Unknown options: {}".format(", ".join(sorted(unknown))))
+        settings = dict(DEFAULT_OPTIONS)
+        settings.update(zip(cls._fields, values))
+        settings.update(kwargs)
+        return super(Options, cls).__new__(cls, **settings)
+
+    @classmethod
+    def from_args(cls, args):
+        """Take the settings from parsed command-line arguments"""
+        return cls(**dict((name, getattr(args, name)) for name in cls._fields))
+
+    @property
+    def visualize(self):
+        return self.show_triangles or self.show_lines or self.show_dots or self.show_glyph
+
+class RunContext(object):
+    """State for one run of the pipeline over one font: the options, the
+    font's em size and the normalized coordinates that the geometry is
+    calculated in (see --normalize-em), and counters for the run summary,
+    e.g. context.stats['outline cache hits']. Runs that go on at the same time
+    each need a RunContext of their own.
+
+    em_scale converts font units to normalized units, geometry_em is the em
+    size in normalized units, and scale_matrix combines the normalization with
+    the --scale option, so that the amount of work doesn't depend on the em
+    size."""
+    def __init__(self, options, em):
+        self.options = options
+        self.em = em
+        if options.normalize_em:
+            self.em_scale = options.normalize_em / float(em)
+        else:
+            self.em_scale = 1.0
+        self.geometry_em = em * self.em_scale
+        self.scale_matrix = calculate_matrix(options.scale * self.em_scale)
+        self.stats = collections.Counter()
+
+    def take_stats(self):
+        """Return the counters gathered so far as a dict, and reset them"""
+        stats = dict(self.stats)
+        self.stats.clear()
+        return stats
 
 # ==============
 # This section is for functions that calculate and return a different data type
@@ -194,12 +316,12 @@ def filtertriangles(triangles, outlines):
 # This section is for functions that actually do things beyond calculations and converting between data types
 # ================
 
-def extract_vectors(points, minlength = None):
+def extract_vectors(points, minlength = None, tolerance = 3):
     """Note: points argument should be a list (or generator) of FF points.
     minlength argument is minimum length that each subdivision should be. If
     not specified, default will be to not subdivide straight lines, and to
     subdivide Bezier curves until the angle change of each segment is less
-    than N degrees, where N is currently 3 but might change in the future."""
+    than N degrees, where N is the tolerance argument (default 3)."""
     points = list(points)
     for candidate in extract_beziers(points):
         if len(candidate) == 2:
@@ -215,7 +337,7 @@ def extract_vectors(points, minlength = None):
         else:
             # It's a Bezier curve
             if minlength is None:
-                subdivision = find_shallow_subdivision(candidate)
+                subdivision = find_shallow_subdivision(candidate, tolerance)
                 #subdivision = 1
             else:
                 segmentlength = float(vectorlength(candidate[-1], candidate[0]))
@@ -237,7 +359,7 @@ def find_shallow_subdivision(bezier, tolerance = 3):
             continue
     return n
 
-def calculate_width(polydata, fudgefactor = 0.05):
+def calculate_width(polydata, context, fudgefactor = 0.05):
     polyline = polydata['line']
     children = polydata.get('immediatechildren', [])
     holes = [item['line'] for item in children]
@@ -249,13 +371,17 @@ def calculate_width(polydata, fudgefactor = 0.05):
 
     # Now recalculate the polyline and polygon based on the calculated width
     # Ensure width is within the bounds set at the command line
-    width = max(width, args.minstrokewidth)
-    width = min(width, args.maxstrokewidth)
+    # (The bounds are in font units, the width in normalized units)
+    options = context.options
+    width = max(width, options.minstrokewidth * context.em_scale)
+    width = min(width, options.maxstrokewidth * context.em_scale)
     polydata['width'] = width
     return width
 
-def recalculate_polys(polydata):
-        width = polydata['width']
+def recalculate_polys(polydata, minlength_factor = 1.0):
+        # Lines are subdivided into pieces of at least the stroke width, times
+        # minlength_factor (which is more than 1 at lower levels of detail)
+        width = polydata['width'] * minlength_factor
         holes = polydata.get('immediatechildren', [])
         for hole_data in holes:
             hole_contour = list(extrapolate_midpoints(list(hole_data['contour'])))
@@ -270,7 +396,43 @@ def recalculate_polys(polydata):
         polydata['line'] = real_polyline
         polydata['poly'] = any_to_polygon(real_polyline, real_hole_contours)
 
-def calculate_midlines(midpoints):
+def decimate_polydata(polydata, width, context):
+    """Reduce the number of points in the flattened outline of a polygon and
+    its holes, to at most options.max_vertices per ring, dropping points where
+    the outline is straight to within options.decimate_tolerance. Edges are
+    kept no longer than options.max_edge_factor times the stroke width, so
+    that the triangulation still works well."""
+    options = context.options
+    tolerance = options.decimate_tolerance
+    if tolerance is None:
+        # Only decimating to meet max_vertices: start out removing points
+        # that are barely off a straight line
+        tolerance = width * 0.01
+    max_edge = width * options.max_edge_factor
+    rings = [polydata] + polydata.get('immediatechildren', [])
+    for data in rings:
+        ring = open_ring(data['line'])
+        decimated = decimate_ring(ring, tolerance, max_edge, options.max_vertices)
+        context.stats['vertices removed by decimation'] += len(ring) - len(decimated)
+        data['line'] = close_ring(decimated)
+
+def repair_polydata(polydata, context):
+    """Clean up the flattened outline of a polygon and its holes (see
+    cleanup.py) before they are triangulated. Updates their 'line's in place,
+    and drops any hole that collapses to nothing from 'immediatechildren'."""
+    children = polydata.get('immediatechildren', [])
+    outline, holes, stats = repair_polygon(polydata['line'], [child['line'] for child in children], context.options.repair_epsilon)
+    polydata['line'] = outline
+    for child, hole in zip(children, holes):
+        child['line'] = hole
+    if None in holes:
+        polydata['immediatechildren'] = [child for child in children if child['line'] is not None]
+    context.stats.update(stats)
+
+def calculate_midlines(midpoints, junctions = True):
+    # If junctions is False, only the lines starting from endpoints are
+    # traced, skipping the more expensive pass that joins lines up at their
+    # intersections. That's used at the lowest level of detail.
     triangles = collections.defaultdict(list)  # Keys are midpoints
     singles = []
     doubles = []
@@ -414,7 +576,7 @@ def calculate_midlines(midpoints):
         drawn_lines.append(current_line)
         current_line = []
 
-    exit_now = False
+    exit_now = not junctions
     while not done() and not exit_now:
         curpt = first_not_in(triples, finished_points)
         if curpt is None:
@@ -477,12 +639,11 @@ def calculate_dots(midlines, radius, spacing):
     # a multiple of radius.
     unit_spacing = spacing * radius
     linestrings = []
-    # Midlines is in the format [line1, line2, line3] and each line (polyline
-    # really) is in the format [[p1,p2], [p2,p3], [p3,p4]..., [p(n-1),pn]]. We
-    # want to use shapely.LineString objects, whose constructor wants the
-    # format [p1, p2, p3, ..., pn].
+    # Midlines is in the format [line1, line2, line3] and each line is a
+    # polyline in the format [p1, p2, p3, ..., pn], as the shapely.LineString
+    # constructor wants it.
     for line in midlines:
-        linestrings.append(any_to_linestring(vectorpairs_to_pointlist(line)))
+        linestrings.append(any_to_linestring(line))
     dots = []
     for line in linestrings:
         if line.length <= 0.0:
@@ -503,6 +664,99 @@ def calculate_dots(midlines, radius, spacing):
             distance += line_spacing
     return dots
 
+def dots_on_midlines(midlines, options):
+    """Place dots along midlines in font units (see extract_midlines) with the
+    radius and spacing in options. Where midlines meet, their dots can land
+    on top of each other, so dots closer than options.prune_distance times
+    the radius to another dot are dropped; the dots at the ends of midlines
+    are kept in preference, since that's where the eye expects a dot.
+    Returns a list of (x, y) tuples."""
+    dots = []
+    priority = []
+    for line in midlines:
+        line_dots = [(ux(dot), uy(dot)) for dot in calculate_dots([line], options.radius, options.spacing)]
+        dots.extend(line_dots)
+        priority.extend(1 if i in (0, len(line_dots) - 1) else 0 for i in range(len(line_dots)))
+    if options.prune_distance:
+        dots = prune_close_dots(dots, options.prune_distance * options.radius, priority)
+    return dots
+
+def parse_unicode_ranges(spec):
+    """Parse a comma-separated list of codepoints and codepoint ranges, such as
+    "U+0041-005A,U+00C0-U+00FF,0x20AC", and return a set of integer codepoints."""
+    def parse_codepoint(s):
+        s = s.strip().upper()
+        for prefix in ('U+', '0X'):
+            if s.startswith(prefix):
+                s = s[len(prefix):]
+        return int(s, 16)
+    codepoints = set()
+    for item in spec.split(','):
+        if not item.strip():
+            continue
+        if '-' in item:
+            first, last = item.split('-', 1)
+            codepoints.update(range(parse_codepoint(first), parse_codepoint(last) + 1))
+        else:
+            codepoints.add(parse_codepoint(item))
+    return codepoints
+
+def select_glyphs(font, text = None, unicodes = None, glyphnames = None):
+    """Return the set of names of the glyphs needed to render the requested
+    subset of the font: the glyphs for the characters in text, the codepoints in
+    unicodes (a range list for parse_unicode_ranges) and the names in glyphnames
+    (comma-separated), plus every glyph that those glyphs reference.
+    Returns None if no subset was requested, meaning "every glyph"."""
+    if not (text or unicodes or glyphnames):
+        return None
+    codepoints = set()
+    if text:
+        if isinstance(text, bytes):
+            text = text.decode('utf-8')
+        codepoints.update(ord(c) for c in text)
+    if unicodes:
+        codepoints.update(parse_unicode_ranges(unicodes))
+    wanted = set()
+    if glyphnames:
+        for name in glyphnames.split(','):
+            name = name.strip()
+            if not name:
+                continue
+            if name in font:
+                wanted.add(name)
+            else:
+                print("WARNING: No glyph named {} in this font".format(name))
+    if codepoints:
+        for glyph in font.glyphs():
+            glyph_codepoints = [glyph.unicode]
+            glyph_codepoints.extend(alt[0] for alt in (glyph.altuni or ()))
+            if any(cp in codepoints for cp in glyph_codepoints):
+                wanted.add(glyph.glyphname)
+    # Composite glyphs need the glyphs they're built from
+    todo = list(wanted)
+    while todo:
+        name = todo.pop()
+        for ref in font[name].references:
+            refname = ref[0]
+            if refname not in wanted:
+                wanted.add(refname)
+                todo.append(refname)
+    return wanted
+
+def print_run_summary(stats):
+    """Print the statistics gathered in a RunContext's stats during a run"""
+    print("Run summary:")
+    for name in sorted(stats):
+        if not name.startswith('outline cache'):
+            value = stats[name]
+            if isinstance(value, float):
+                value = "{:.2f}".format(value)
+            print("    {}: {}".format(name, value))
+    lookups = stats['outline cache hits'] + stats['outline cache misses']
+    if lookups:
+        print("    outline cache: {} hits out of {} glyphs ({:.1f}%)".format(
+            stats['outline cache hits'], lookups, 100.0 * stats['outline cache hits'] / lookups))
+
 def silent_fontopen(fname):
     # Fontforge opens fonts in C code, so we can't redirect Python's sys.stderr
     # to /dev/null and hope that that will work. We need to redirect the
@@ -517,48 +771,413 @@ def silent_fontopen(fname):
     os.close(origstderr)
     return fontobj
 
-def create_dotted_font(fname):
+def dot_glyph(contours, options = None, em = 1000):
+    """Calculate the dots for a list of FontForge contours (or a layer, such
+    as glyph.foreground) from a font with the given em size, and return them
+    as a list of (x, y) tuples in font units. The contours are left as they
+    were. This is the way in for other programs that just want the dots."""
+    context = RunContext(options or Options(), em)
+    contours = [contour.dup() for contour in contours]
+    return [(ux(dot), uy(dot)) for dot in extract_dots(contours, context, False)]
+
+def dot_font(fname, output, options = None, confirm_name = None, variants = ()):
+    """Create a dotted copy of the font in fname, and write it to output (as
+    SFD if its name ends in .sfd, as a UFO if it ends in .ufo, otherwise in
+    the format FontForge picks from the extension), or to each of a list of
+    outputs (see write_dotted_font). Returns the run's statistics, for
+    print_run_summary.
+
+    variants is a list of further (radius, spacing, output) tuples, each
+    written as well. Only the dots depend on the radius and spacing, so the
+    midlines are calculated once and every variant's dots placed on them.
+
+    If options.font_name is empty, the new font is named after the original
+    plus " Dotted", which does NOT comply with the Open Font License; if
+    confirm_name is given, it's called with that name before anything is
+    written, and may raise an exception (or KeyboardInterrupt) to stop."""
+    options = options or Options()
+    start = time.time()
     input_font = silent_fontopen(fname)
-    global args
-    args.em = input_font.em
-    if args.font_name:
-        new_familyname = args.font_name
+    context = RunContext(options, input_font.em)
+    context.stats['opening fonts (seconds)'] += time.time() - start
+    if options.font_name:
+        new_familyname = options.font_name
     else:
         new_familyname = input_font.familyname + " Dotted"
-        print("WARNING: New font name \"{}\" does NOT comply with the Open Font License!!".format(new_familyname))
-        print("Please press Enter to proceed anyway, or Ctrl-C to exit.")
-        print("By proceeding, you acknowledge that you do NOT intend to distribute this font to anyone else.")
-        raw_input()
+        if confirm_name is not None:
+            confirm_name(new_familyname)
     new_fullname = input_font.fullname.replace(input_font.familyname, new_familyname)
     new_fontname = new_fullname.translate(None, " \t()[]{}<>/%")
-    shutil.copy2(fname, args.output)
-    new_font = silent_fontopen(args.output)
-    new_font.familyname = new_familyname
-    new_font.fullname = new_fullname
-    new_font.fontname = new_fontname
-    for glyphname in input_font:
-        if glyphname in ('.notdef', '.null'): continue
-        glyph = input_font[glyphname]
+    names = (new_familyname, new_fullname, new_fontname)
+    subset = select_glyphs(input_font, options.text, options.unicodes, options.glyphs)
+    if subset is not None:
+        print("Building a subset of {} glyphs".format(len(subset)))
+    outputs = [output] if isinstance(output, basestring) else list(output)
+    journal = GlyphJournal(outputs[0] + '.journal', journal_settings(fname, options),
+        resume = options.resume, checkpoint_every = options.checkpoint_every)
+    if len(journal):
+        print("Resuming: {} glyphs already done according to {}".format(len(journal), journal.path))
+    # Midlines of finished glyphs, by name, so composite glyphs can reuse them
+    midline_cache = dict(journal.completed)
+    # Midlines of finished outlines, by outline_fingerprint, for duplicate glyphs
+    outline_cache = {}
+    seed_outline_cache(input_font, journal.completed, context, outline_cache)
+    glyphnames = [glyphname for glyphname in input_font
+        if glyphname not in ('.notdef', '.null') and (subset is None or glyphname in subset)]
+    pending = [glyphname for glyphname in glyphnames if glyphname not in journal]
+    if options.save_stages and not os.path.isdir(options.save_stages):
+        os.makedirs(options.save_stages)
+    glyph_stats = load_glyph_stats(options.stats)
+    measured = dict((name, data['seconds']) for name, data in glyph_stats.items() if 'seconds' in data)
+    try:
+        for glyphname, midlines, report in calculate_all_midlines(input_font, fname, context, pending, midline_cache, outline_cache, measured):
+            journal.record(glyphname, midlines)
+            glyph_stats[glyphname] = report
+    finally:
+        # Make sure a Ctrl-C or an exception doesn't lose finished glyphs
+        journal.close()
+        if options.stats:
+            save_glyph_stats(options.stats, glyph_stats)
+    # A resumed journal may also hold glyphs outside this run's subset, which
+    # mustn't count towards a whole-font target
+    written = dict((glyphname, journal.completed[glyphname]) for glyphname in glyphnames)
+    options, glyph_spacing = choose_spacing(written, options, input_font.em)
+    # With --in-place the input font is changed by the first write, so take
+    # what's needed of the original glyphs beforehand
+    originals = snapshot_glyphs(input_font, glyphnames)
+    write_dotted_font(fname, input_font, outputs, options, names, subset, glyphnames, journal.completed,
+        glyph_spacing, originals, context.stats)
+    for radius, spacing, variant_output in variants:
+        variant_options = options._replace(radius = radius, spacing = spacing)
+        write_dotted_font(fname, input_font, variant_output, variant_options, names, subset, glyphnames, journal.completed,
+            None, originals, context.stats)
+    journal.remove()
+    if resource is not None:
+        # ru_maxrss is in kilobytes on Linux (bytes on Mac OS X)
+        megabyte = 1024.0 * 1024.0 if sys.platform == 'darwin' else 1024.0
+        context.stats['peak memory (MB)'] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / megabyte
+        workers = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss
+        if workers:
+            context.stats['peak memory of a child process (MB)'] = workers / megabyte
+    if options.visualize:
+        print("Press any key to exit")
+        import visualization
+        visualization.wait_for_keypress(context.geometry_em, options.zoom)
+    return context.stats
+
+def choose_spacing(midlines, options, em):
+    """If the options give a target for the dots (see dotsolver.py), search
+    for the spacing that meets it best, given the midlines of every glyph.
+    Returns the options with that spacing, and a dict of glyph name ->
+    spacing if options.target_per_glyph asks for one per glyph (else None)."""
+    for target in TARGETS:
+        value = getattr(options, 'target_' + target)
+        if value is not None:
+            break
+    else:
+        return options, None
+    if options.target_per_glyph:
+        solved = solve_glyphs(target, value, midlines, options.radius, em)
+        if solved:
+            spacings = sorted(spacing for spacing, achieved in solved.values())
+            print("Target {} {}: chose spacings from {:.3f} to {:.3f} (median {:.3f}) for {} glyphs".format(
+                target, value, spacings[0], spacings[-1], spacings[len(spacings) // 2], len(spacings)))
+            missed = [(abs(achieved - value), glyphname, achieved) for glyphname, (spacing, achieved) in solved.items()]
+            worst, glyphname, achieved = max(missed)
+            print("    Furthest from the target: glyph {} at {:.2f} {}".format(glyphname, achieved, target))
+        return options, dict((glyphname, spacing) for glyphname, (spacing, achieved) in solved.items())
+    solved = solve_font(target, value, midlines, options.radius, em)
+    if solved is None:
+        print("WARNING: No midlines to aim for the target {} {} with".format(target, value))
+        return options, None
+    spacing, achieved = solved
+    print("Target {} {}: chose spacing {:.3f} (-s), which gives {:.2f} {}".format(target, value, spacing, achieved, target))
+    return options._replace(spacing = spacing), None
+
+def write_dotted_font(fname, input_font, output, options, names, subset, glyphnames, midlines,
+        glyph_spacing = None, originals = None, stats = None):
+    """Write a copy of the font in fname to output, renamed to names (a tuple of
+    family name, full name and font name), trimmed down to subset (if not
+    None), and with each named glyph made of dots placed on its midlines (a
+    dict of glyph name -> midlines) with the given options' radius and spacing.
+    glyph_spacing, if given, is a dict of glyph name -> spacing for the glyphs
+    that should use a spacing of their own. An output ending in .ufo is
+    written as a UFO (see write_ufo).
+
+    output may also be a list of file names, to write the same dotted font
+    in several formats. The dots are made once; if more than one output is
+    written by FontForge, the dotted font is saved once as an SFD file, and
+    a process for each output converts that to the output's format.
+
+    With options.in_place, input_font itself is changed and written out, and
+    the metrics and anchors of the original glyphs come from originals (see
+    snapshot_glyphs), which must have been taken before the first change.
+    The time spent opening fonts, and writing each output, is added to
+    stats, if given."""
+    if originals is None:
+        originals = snapshot_glyphs(input_font, glyphnames)
+    dots = {}
+    for glyphname in glyphnames:
+        glyph_options = options
+        if glyph_spacing and glyphname in glyph_spacing:
+            glyph_options = options._replace(spacing = glyph_spacing[glyphname])
+        dots[glyphname] = dots_on_midlines(midlines[glyphname], glyph_options)
+    if stats is None:
+        stats = collections.Counter()
+    fontforge_outputs = []
+    for output in ([output] if isinstance(output, basestring) else output):
+        start = time.time()
+        if output.lower().rstrip('/' + os.sep).endswith('.ufo'):
+            write_ufo(fname, input_font, output, options, names, subset, dots, originals)
+        elif options.writer == 'direct' and try_write_direct(fname, output, options, names, subset, dots, originals):
+            print("Dotted font created as", output)
+        else:
+            fontforge_outputs.append(output)
+            continue
+        stats['writing {} (seconds)'.format(output)] += time.time() - start
+    if not fontforge_outputs:
+        return
+    if options.in_place:
+        new_font = input_font
+    elif len(fontforge_outputs) == 1:
+        start = time.time()
+        shutil.copy2(fname, fontforge_outputs[0])
+        new_font = silent_fontopen(fontforge_outputs[0])
+        stats['opening fonts (seconds)'] += time.time() - start
+    else:
+        # Only the intermediate SFD is saved from this font, so the input can
+        # be opened again as it is, rather than leaving an undotted copy under
+        # an output's name if writing the outputs fails
+        start = time.time()
+        new_font = silent_fontopen(fname)
+        stats['opening fonts (seconds)'] += time.time() - start
+    start = time.time()
+    new_font.familyname, new_font.fullname, new_font.fontname = names
+    trim_to_subset(new_font, subset)
+    for glyphname in glyphnames:
         new_glyph = new_font[glyphname]
         new_glyph.clear()
-        print("Processing glyph at codepoint U+{:04X} named {}".format(glyph.encoding, glyphname))
-        glyph.unlinkRef()
-        copy_glyph(glyph, new_glyph)
-    font_type = args.output.lower().rsplit('.', 1)[-1]
-    if font_type == 'sfd':
-        new_font.save(args.output)
+        copy_glyph(originals[glyphname], new_glyph, options, dots[glyphname])
+    stats['making dotted glyphs (seconds)'] += time.time() - start
+    if len(fontforge_outputs) == 1:
+        output = fontforge_outputs[0]
+        start = time.time()
+        save_font(new_font, output)
+        stats['writing {} (seconds)'.format(output)] += time.time() - start
+        print("Dotted font created as", output)
     else:
-        new_font.generate(args.output)
-    print("Dotted font created as", args.output)
-    if args.visualize:
-        print("Press any key to exit")
-        import visualization
-        visualization.wait_for_keypress(args.em, args.zoom)
+        # Save the dotted font once, and have a process for each output
+        # read that and write it in its own format, all at the same time
+        handle, intermediate = tempfile.mkstemp(suffix = '.sfd', dir = os.path.dirname(os.path.abspath(fontforge_outputs[0])))
+        os.close(handle)
+        try:
+            start = time.time()
+            new_font.save(intermediate)
+            stats['saving intermediate SFD (seconds)'] += time.time() - start
+            if not options.in_place:
+                new_font.close()
+                new_font = None
+            pool = multiprocessing.Pool(len(fontforge_outputs), init_world_worker)
+            try:
+                jobs = [(intermediate, output) for output in fontforge_outputs]
+                for output, seconds in pool.imap_unordered(worker_save_font, jobs):
+                    stats['writing {} (seconds)'.format(output)] += seconds
+                    print("Dotted font created as", output)
+                pool.close()
+            finally:
+                pool.terminate()
+                pool.join()
+        finally:
+            os.remove(intermediate)
+    if new_font is not None and not options.in_place:
+        new_font.close()
+
+def save_font(font, output):
+    """Write font to output, as SFD if its name ends in .sfd, otherwise in the
+    format FontForge picks from the extension"""
+    if output.lower().rsplit('.', 1)[-1] == 'sfd':
+        font.save(output)
+    else:
+        font.generate(output)
 
-def extraction_demo(fname, letter):
+def worker_save_font(job):
+    """Run in a process of its own: write the dotted font, saved as an SFD
+    file, to one of the outputs. Returns (output, seconds taken)."""
+    intermediate, output = job
+    start = time.time()
+    if output.lower().rsplit('.', 1)[-1] == 'sfd':
+        shutil.copyfile(intermediate, output)
+    else:
+        font = silent_fontopen(intermediate)
+        font.generate(output)
+        font.close()
+    return output, time.time() - start
+
+def snapshot_glyphs(font, glyphnames):
+    """Take what the font writers need of the original glyphs (their metrics,
+    anchors and glyph ids), so that the font can be changed in place. Returns
+    a dict of glyph name -> AttrDict, with the same attribute names as a
+    FontForge glyph."""
+    originals = {}
+    for glyphname in glyphnames:
+        glyph = font[glyphname]
+        originals[glyphname] = AttrDict(
+            width = glyph.width, vwidth = glyph.vwidth, anchorPoints = glyph.anchorPoints,
+            left_side_bearing = glyph.left_side_bearing, right_side_bearing = glyph.right_side_bearing,
+            originalgid = glyph.originalgid)
+    return originals
+
+def trim_to_subset(font, subset):
+    """Remove the glyphs that aren't in subset (if not None) from font,
+    apart from the special glyphs"""
+    if subset is None:
+        return
+    for glyphname in list(font):
+        if glyphname not in subset and glyphname not in ('.notdef', '.null'):
+            font.removeGlyph(glyphname)
+
+def write_ufo(fname, input_font, output, options, names, subset, dots, originals):
+    """Write the dotted font as a UFO, given a dict of glyph name -> dots.
+    FontForge writes everything but the outlines of the dotted glyphs, unless
+    the UFO was already made from the same font, names and subset; then
+    ufowriter.py writes those outlines, options.jobs glyphs at a time,
+    skipping the glyphs whose dots haven't changed since the last run.
+    originals are as for write_dotted_font. An existing directory is only
+    replaced if it's a UFO; anything else raises IOError."""
+    stat = os.stat(fname)
+    source = [os.path.abspath(fname), stat.st_size, int(stat.st_mtime), list(names),
+        sorted(subset) if subset is not None else None, sorted(dots)]
+    if load_manifest(output, source) is None:
+        if os.path.isdir(output):
+            # Never delete a directory that just happens to end in .ufo
+            if not (os.path.exists(os.path.join(output, MANIFEST_NAME)) or
+                    os.path.exists(os.path.join(output, 'metainfo.plist'))):
+                raise IOError("{} exists and isn't a UFO, so it won't be replaced".format(output))
+            shutil.rmtree(output)
+        new_font = input_font if options.in_place else silent_fontopen(fname)
+        new_font.familyname, new_font.fullname, new_font.fontname = names
+        trim_to_subset(new_font, subset)
+        for glyphname in dots:
+            new_font[glyphname].clear()
+        new_font.generate(output)
+        if not options.in_place:
+            new_font.close()
+    glyphs = {}
+    for glyphname, glyph_dots in dots.items():
+        glyph_dots = [(ux(dot), uy(dot)) for dot in glyph_dots]
+        width, shift = None, 0
+        if options.copy_bearings and glyph_dots:
+            # Move the dots and set the width to keep the original's bearings
+            orig_glyph = originals[glyphname]
+            left = min(x for x, y in glyph_dots) - options.radius
+            right = max(x for x, y in glyph_dots) + options.radius
+            shift = orig_glyph.left_side_bearing - left
+            width = right + shift + orig_glyph.right_side_bearing
+        glyphs[glyphname] = (glyph_dots, width, shift)
+    written = write_dotted_glyphs(output, source, glyphs, options.radius, options.jobs)
+    print("Dotted font created as {} ({} of {} dotted glyphs written, the rest unchanged)".format(output, written, len(glyphs)))
+
+def try_write_direct(fname, output, options, names, subset, dots, originals):
+    """Write the dotted font with write_direct if it can be done that way.
+    Returns whether it was."""
+    try:
+        write_direct(fname, output, options, names, subset, dots, originals)
+        return True
+    except UnsupportedFont as e:
+        print("Writing {} with FontForge instead: {}".format(output, e))
+        return False
+
+def write_direct(fname, output, options, names, subset, dots, originals):
+    """Write the dotted font with sfntwriter.py instead of FontForge, given a
+    dict of glyph name -> dots and the original glyphs (see snapshot_glyphs).
+    Raises UnsupportedFont if it can't be done."""
+    if output.lower().rsplit('.', 1)[-1] != 'ttf':
+        raise UnsupportedFont("only .ttf output can be written directly")
+    if subset is not None:
+        raise UnsupportedFont("subsets can't be written directly")
+    glyphs = {}
+    glyph_names = {}
+    for glyphname, glyph_dots in dots.items():
+        gid = originals[glyphname].originalgid
+        if gid < 0:
+            raise UnsupportedFont("glyph {} isn't in {}".format(glyphname, fname))
+        glyphs[gid] = glyph_dots
+        glyph_names[gid] = glyphname
+    write_dotted_ttf(fname, output, glyphs, options.radius, names, options.copy_bearings, glyph_names)
+
+def calculate_all_midlines(font, fname, context, glyphnames, midline_cache, outline_cache, measured = None):
+    """Calculate the midlines for the named glyphs, yielding a (glyphname,
+    midlines, report) tuple as each glyph is finished, where report is a dict
+    holding the seconds taken and the level of detail used ('lod'). If
+    options.jobs is more than 1, the glyphs are shared out among that many
+    worker processes, most expensive first (see scheduler.py); measured is a
+    dict of glyph name -> seconds from an earlier run, used to estimate how
+    expensive each glyph is."""
+    options = context.options
+    if options.jobs <= 1 or options.visualize:
+        for glyphname in glyphnames:
+            glyph = font[glyphname]
+            print("Processing glyph at codepoint U+{:04X} named {}".format(glyph.encoding, glyphname))
+            start = time.time()
+            report = {'lod': 0}
+            midlines = saved_glyph_midlines(glyph, context, midline_cache, options.visualize, outline_cache, report)
+            report['seconds'] = time.time() - start
+            report_level_of_detail(glyphname, report, context)
+            yield glyphname, midlines, report
+        return
+    costs = estimate_costs(font, glyphnames, measured)
+    order = largest_first(costs)
+    predicted = predict_makespan([costs[glyphname] for glyphname in order], options.jobs)
+    print("Processing {} glyphs in {} processes, predicted to take {:.1f} seconds".format(len(order), options.jobs, predicted))
+    start = time.time()
+    # Each worker starts with the midlines finished so far (e.g. by an
+    # earlier run that is being resumed), as the caches here do
+    pool = multiprocessing.Pool(options.jobs, init_worker, (fname, options, midline_cache))
+    try:
+        results = pool.imap_unordered(worker_glyph_midlines, order)
+        for count, (glyphname, midlines, report, stats) in enumerate(results, 1):
+            context.stats.update(stats)
+            print("Finished glyph {} ({} of {})".format(glyphname, count, len(order)))
+            report_level_of_detail(glyphname, report, context)
+            yield glyphname, midlines, report
+        pool.close()
+    finally:
+        pool.terminate()
+        pool.join()
+    context.stats['predicted makespan (seconds)'] = predicted
+    context.stats['actual makespan (seconds)'] = time.time() - start
+
+# Per-process state of the worker processes used by calculate_all_midlines
+worker_state = AttrDict()
+
+def init_worker(fname, options, completed):
+    # Let the main process deal with Ctrl-C
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    worker_state.font = silent_fontopen(fname)
+    worker_state.context = RunContext(options, worker_state.font.em)
+    worker_state.midline_cache = dict(completed)
+    worker_state.outline_cache = {}
+    seed_outline_cache(worker_state.font, completed, worker_state.context, worker_state.outline_cache)
+
+def worker_glyph_midlines(glyphname):
+    """Run in a worker process: calculate one glyph's midlines, and return
+    them with the glyph's report and the stats counted while doing so."""
+    start = time.time()
+    glyph = worker_state.font[glyphname]
+    report = {'lod': 0}
+    midlines = saved_glyph_midlines(glyph, worker_state.context, worker_state.midline_cache, False, worker_state.outline_cache, report)
+    report['seconds'] = time.time() - start
+    return glyphname, midlines, report, worker_state.context.take_stats()
+
+def report_level_of_detail(glyphname, report, context):
+    if report.get('lod'):
+        print("Glyph {} ran short of time, and was finished at level of detail {}".format(glyphname, report['lod']))
+        context.stats['glyphs finished at level of detail {}'.format(report['lod'])] += 1
+
+def extraction_demo(fname, letter, options = None):
+    options = options or Options()
     font = silent_fontopen(fname)
-    global args
-    args.em = font.em
+    context = RunContext(options, font.em)
     if isinstance(letter, int):
         codepoint = letter
     elif letter.startswith('U+'):
@@ -566,41 +1185,442 @@ def extraction_demo(fname, letter):
     else:
         codepoint = letter
     glyph = font[codepoint]
-    glyph.unlinkRef()
-    dots = extract_dots(glyph, args.visualize)
+    dots = glyph_dots(glyph, context, {}, options.visualize)
     print("{} dots found".format(len(dots)))
-    if args.visualize:
+    if options.visualize:
         import visualization
-        visualization.wait_for_keypress(args.em, args.zoom)
+        visualization.wait_for_keypress(context.geometry_em, options.zoom)
+    return dots
 
-def extract_dots(glyph, show_glyph=True):
-    global args
-    if args.visualize or show_glyph:
+def draw_contact_sheets(fname, directory, options = None):
+    """Draw every glyph of the font in fname (or the subset chosen by the
+    options) into PNG contact sheets in directory: a grid of small pictures
+    showing each glyph's outline, triangulation, midlines and dots, for
+    checking a whole font at a glance. No display is needed. The glyphs are
+    calculated as for dot_font, by options.jobs processes, and drawn in font
+    order as they come in. Returns the run's statistics, for
+    print_run_summary."""
+    options = options or Options()
+    import visualization
+    font = silent_fontopen(fname)
+    context = RunContext(options, font.em)
+    subset = select_glyphs(font, options.text, options.unicodes, options.glyphs)
+    glyphnames = [glyphname for glyphname in font
+        if glyphname not in ('.notdef', '.null') and (subset is None or glyphname in subset)]
+    for path in (directory, options.save_stages):
+        if path and not os.path.isdir(path):
+            os.makedirs(path)
+    sheets = visualization.ContactSheets(directory, context.geometry_em)
+    # Glyphs that have finished before the ones in front of them
+    finished = {}
+    drawn = 0
+    for glyphname, midlines, report in calculate_all_midlines(font, fname, context, glyphnames, {}, {}):
+        stages = report.pop('stages')
+        stages['dots'] = [(x * context.em_scale, y * context.em_scale) for x, y in dots_on_midlines(midlines, options)]
+        stages['radius'] = options.radius * context.em_scale
+        finished[glyphname] = stages
+        while drawn < len(glyphnames) and glyphnames[drawn] in finished:
+            sheets.add(glyphnames[drawn], finished.pop(glyphnames[drawn]))
+            drawn += 1
+    sheets.close()
+    print("{} glyphs drawn on {} contact sheets in {}".format(len(glyphnames), sheets.pages, directory))
+    context.stats['drawing contact sheets (seconds)'] = sheets.seconds
+    return context.stats
+
+def is_reusable_transform(matrix):
+    """Check whether a reference with this transformation matrix can reuse the
+    midlines of the glyph it refers to. That's true if the reference only moves
+    or mirrors the glyph: scaling, rotating or skewing it would change the
+    length of its midlines, and so where the dots should go."""
+    xx, xy, yx, yy, dx, dy = matrix
+    return xy == 0 and yx == 0 and abs(xx) == 1 and abs(yy) == 1
+
+def transform_points(points, matrix, scale = 1.0):
+    """Apply a reference's transformation matrix (see is_reusable_transform)
+    to points that were calculated after the glyph was scaled by scale."""
+    xx, xy, yx, yy, dx, dy = matrix
+    return [(xx * ux(p) + dx * scale, yy * uy(p) + dy * scale) for p in points]
+
+def glyph_dots(glyph, context, cache, show_glyph = False, outline_cache = None, report = None):
+    """Calculate the dots for a glyph with the context's radius and spacing;
+    see glyph_midlines. Returns the dots in font units."""
+    midlines = glyph_midlines(glyph, context, cache, show_glyph, outline_cache, report)
+    return dots_on_midlines(midlines, context.options)
+
+def save_stages(glyphname, stages, dots, context, report = None):
+    """Save a glyph's stages and dots into the --save-stages directory, with
+    the settings and coordinate scale needed to make sense of them"""
+    info = {
+        'em': context.em,
+        'em_scale': context.em_scale,
+        'geometry_em': context.geometry_em,
+        'lod': (report or {}).get('lod', 0),
+        'options': context.options._asdict(),
+    }
+    # Where the midlines came from, if not (only) from the glyph's own outline
+    for name in ('components', 'copy_of'):
+        if name in stages:
+            info[name] = stages[name]
+    path = stagefile.stages_path(context.options.save_stages, glyphname)
+    stagefile.save_stages(path, glyphname, stages, dots, info)
+
+def saved_glyph_midlines(glyph, context, cache, show_glyph = False, outline_cache = None, report = None):
+    """glyph_midlines, also saving the stages of the glyph into the
+    --save-stages directory, if there is one (see stagefile.py), and with
+    --contact-sheet, putting the stages that the contact sheet draws into
+    report['stages']. Saving the stages doesn't change how the midlines are
+    calculated: what was done is saved (see glyph_midlines), with a file of
+    its own for each referenced glyph calculated on the way. Contact sheets
+    picture each glyph whole, so with --contact-sheet, glyphs are always
+    unlinked and processed without the caches."""
+    options = context.options
+    for_sheet = options.contact_sheet and report is not None
+    if not options.save_stages and not for_sheet:
+        return glyph_midlines(glyph, context, cache, show_glyph, outline_cache, report)
+    stages = {}
+    midlines = glyph_midlines(glyph, context, cache, show_glyph, outline_cache, report, stages,
+        whole = bool(options.contact_sheet))
+    if options.save_stages:
+        start = time.time()
+        computed = stages.pop('computed', {})
+        # A glyph found in cache had its stages saved when it was calculated
+        if not stages.get('cached'):
+            save_stages(glyph.glyphname, stages, dots_on_midlines(midlines, options), context, report)
+        for glyphname, base_stages in computed.items():
+            save_stages(glyphname, base_stages, dots_on_midlines(cache[glyphname], options), context)
+        context.stats['saving stages (seconds)'] += time.time() - start
+    if for_sheet:
+        # Only what's drawn, to keep what worker processes send back small
+        report['stages'] = dict((name, stages[name]) for name in ('outlines', 'triangles', 'midlines'))
+    return midlines
+
+def glyph_midlines(glyph, context, cache, show_glyph = False, outline_cache = None, report = None, stages = None,
+        whole = False):
+    """Calculate the midlines for a glyph. If the glyph is a composite, the
+    midlines of the glyphs it references are calculated once (and stored in
+    cache, a dict of glyph name -> midlines) and copied into place, rather
+    than unlinking the references and processing the whole outline again.
+    References that are scaled or rotated fall back to unlinking, as does
+    visualization, so that the whole glyph gets drawn. With whole, the
+    glyph is always unlinked and processed without looking in the caches,
+    for pictures of the whole glyph (the viewer and contact sheets).
+
+    report and stages are passed on to extract_midlines. Giving stages
+    doesn't change how the midlines are calculated: a glyph already in cache
+    gets stages['cached'] = True and nothing else, and a composite whose
+    references were reused gets the stages of its own contours, plus
+    'components', a list of (glyph name, transformation matrix) of its
+    references, and 'computed', a dict of glyph name -> stages of each
+    glyph it refers to (directly or not) that was calculated on the way."""
+    glyphname = glyph.glyphname
+    if whole:
+        outline_cache = None
+    if glyphname in cache and not whole:
+        if stages is not None:
+            stages['cached'] = True
+        return cache[glyphname]
+    if stages is not None:
+        # For the outline cache to say which glyph its midlines came from
+        stages['glyphname'] = glyphname
+    references = glyph.references
+    if (references and not show_glyph and not whole and
+            all(is_reusable_transform(ref[1]) for ref in references)):
+        # The glyph's own contours (if any) are processed on their own
+        midlines = list(extract_midlines(glyph.foreground, context, False, outline_cache, report, stages))
+        components = []
+        computed = {}
+        for ref in references:
+            refname, matrix = ref[0], ref[1]
+            base_stages = {} if stages is not None else None
+            base_midlines = glyph_midlines(glyph.font[refname], context, cache, outline_cache = outline_cache,
+                stages = base_stages)
+            midlines.extend(transform_points(line, matrix, context.options.scale) for line in base_midlines)
+            if stages is not None:
+                components.append((refname, list(matrix)))
+                computed.update(base_stages.pop('computed', {}))
+                if not base_stages.get('cached'):
+                    computed[refname] = base_stages
+        if stages is not None:
+            stages['components'] = components
+            stages['computed'] = computed
+        context.stats['composite glyphs reused'] += 1
+    else:
+        glyph.unlinkRef()
+        midlines = extract_midlines(glyph.foreground, context, show_glyph, outline_cache, report, stages)
+    cache[glyphname] = midlines
+    return midlines
+
+def seed_outline_cache(font, completed, context, outline_cache):
+    """Fill outline_cache from the midlines of glyphs finished by an earlier
+    run (completed, a dict of glyph name -> midlines from the journal), so that
+    a resumed run gives duplicates of them the same midlines as a run that
+    wasn't interrupted. Composite glyphs are left out, since their midlines
+    aren't those of their own outline alone. With -j, each worker process
+    seeds an outline cache of its own (see init_worker)."""
+    for glyphname, midlines in completed.items():
+        if glyphname not in font or font[glyphname].references:
+            continue
+        contours = [contour for contour in font[glyphname].foreground if is_sane_contour(contour)]
+        if not contours:
+            continue
+        for contour in contours:
+            scale_by(contour, context.scale_matrix)
+        key, origin = outline_fingerprint(contours)
+        # The level of detail reached isn't in the journal
+        outline_cache.setdefault(key, (midlines, origin, 0, glyphname))
+
+def outline_fingerprint(contours):
+    """Return a (key, origin) tuple for a list of FontForge contours. The key
+    is the same for any two outlines that only differ in their position, and
+    the origin is that position (the lowest x and y of any point)."""
+    points = [p for contour in contours for p in contour]
+    if not points:
+        return (), (0.0, 0.0)
+    x0 = min(p.x for p in points)
+    y0 = min(p.y for p in points)
+    key = tuple(
+        (contour.closed, tuple((round(p.x - x0, 6), round(p.y - y0, 6), p.on_curve) for p in contour))
+        for contour in contours)
+    return key, (x0, y0)
+
+# Settings for each level of detail, from the best to the cheapest. With
+# --glyph-budget, a glyph that has used up the given fraction of its time
+# budget has the rest of its outline processed at the next level down.
+LEVELS_OF_DETAIL = [
+    # Curves flattened to 3 degree angles, lines cut at the stroke width
+    AttrDict(after = 0.0, curve_tolerance = 3, minlength_factor = 1.0, junctions = True),
+    AttrDict(after = 0.5, curve_tolerance = 8, minlength_factor = 2.0, junctions = True),
+    # Midlines aren't joined up at intersections
+    AttrDict(after = 0.8, curve_tolerance = 15, minlength_factor = 4.0, junctions = False),
+]
+
+class GlyphBudget(object):
+    """Keeps track of the time spent on a glyph, for --glyph-budget. As the time
+    used nears the budget, level() steps down through LEVELS_OF_DETAIL; it
+    never steps back up within a glyph. With no budget, it stays at level 0."""
+    # Shortest timeout we'll give a triangulation, even when out of budget
+    min_timeout = 0.1
+
+    def __init__(self, seconds = None, start = None):
+        self.seconds = seconds
+        self.start = time.time() if start is None else start
+        self.lod = 0
+
+    def level(self):
+        if self.seconds:
+            used = (time.time() - self.start) / self.seconds
+            while self.lod + 1 < len(LEVELS_OF_DETAIL) and used >= LEVELS_OF_DETAIL[self.lod + 1].after:
+                self.lod += 1
+        return self.lod
+
+    def degrade(self):
+        """Step down one level of detail, after a failure. Returns False if
+        there's no budget, or no cheaper level left to try."""
+        if not self.seconds or self.lod + 1 >= len(LEVELS_OF_DETAIL):
+            return False
+        self.lod += 1
+        return True
+
+    def remaining(self):
+        if not self.seconds:
+            return None
+        return max(self.seconds - (time.time() - self.start), self.min_timeout)
+
+def triangulate_world(polydata, budget, context):
+    """Recalculate the outline of a polygon and its holes at the stroke width,
+    clean it up and triangulate it. If the triangulation fails and the glyph
+    has a time budget, try again at a cheaper level of detail. Returns the
+    list of triangles, or None if nothing is left of the polygon."""
+    while True:
+        detail = LEVELS_OF_DETAIL[budget.level()]
+        # Recalculate the data['poly'] and data['line'] shapes,
+        # subdividing Beziers and vectors based on calculated width
+        recalculate_polys(polydata, detail.minlength_factor)
+        options = context.options
+        if options.max_vertices or options.decimate_tolerance:
+            decimate_polydata(polydata, polydata['width'] * detail.minlength_factor, context)
+        if options.repair:
+            repair_polydata(polydata, context)
+            if len(polydata['line']) < 4:
+                # Nothing left of this polygon but a sliver
+                return None
+        children = polydata.get('immediatechildren', [])
+        triangles = make_triangles(polydata, children, max_timeout = budget.remaining(), stats = context.stats)
+        if triangles is not None:
+            return triangles
+        if not budget.degrade():
+            print("WARNING: Glyph processing failed for this glyph.")
+            return []
+
+def world_task(polydata):
+    """Convert an outside polygon and its holes (dicts from calculate_parents)
+    into plain data that can be sent to another process for process_world:
+    FontForge contours become lists of (x, y, on_curve) tuples."""
+    def ring(data):
+        return {
+            'line': list(any_to_polyline(data['line'])),
+            'contour': [(p.x, p.y, p.on_curve) for p in data['contour']],
+        }
+    task = ring(polydata)
+    task['holes'] = [ring(child) for child in polydata.get('immediatechildren', [])]
+    return task
+
+def process_world(task, budget, context):
+    """Take one "world" (from world_task) through the rest of the pipeline:
+    stroke width, triangulation, filtering and midlines. Returns a dict of the
+    results of each stage, or None if nothing was left of the polygon."""
+    def polydata_from(data):
+        contour = [fontforge.point(x, y, on_curve) for x, y, on_curve in data['contour']]
+        return {'line': data['line'], 'contour': contour}
+    polydata = polydata_from(task)
+    polydata['immediatechildren'] = [polydata_from(hole) for hole in task['holes']]
+    width = calculate_width(polydata, context)
+    triangles = triangulate_world(polydata, budget, context)
+    if triangles is None:
+        return None
+    real_polyline = polydata['line']
+    children = polydata.get('immediatechildren', [])
+    trianglelines = map(triangle2lines, triangles)
+    outside_polyline = list(any_to_polyline(real_polyline))
+    outside_polyline.append(outside_polyline[0])  # Close it
+    holes = map(any_to_closedpolyline, [child['line'] for child in children])
+    outlines_to_filter = [outside_polyline] + holes
+    real_trianglelines = list(filtertriangles(trianglelines, outlines_to_filter))
+    midpoints = list(itermap_stopatvectors(averagepoint_as_tuplevector, real_trianglelines))
+    # Structure of midpoints now:
+    # [t1, t2, t3] where t1, t2, t3 are: [m1, m2, m3] or [m1, m2] or [m1]
+    # And m1, m2, m3 are (x, y)
+    # Basically, each triangle's vectors have been changed to midpoints,
+    # but the structure still remains
+    midlines = list(calculate_midlines(midpoints, LEVELS_OF_DETAIL[budget.lod].junctions))
+    return {
+        'width': width,
+        'line': list(any_to_polyline(real_polyline)),
+        'holes': holes,
+        'triangles': triangles,
+        'edges': real_trianglelines,
+        'midpoints': midpoints,
+        'midlines': map(vectorpairs_to_pointlist, midlines),
+    }
+
+# Per-process pool for processing the worlds of a glyph in parallel (see
+# --world-jobs). It's started by the first glyph that needs it, with that
+# glyph's world_jobs setting, and shared by every run in the process.
+world_pool = None
+world_pool_lock = threading.Lock()
+
+def get_world_pool(processes):
+    global world_pool
+    with world_pool_lock:
+        if world_pool is None:
+            world_pool = multiprocessing.Pool(processes, init_world_worker)
+            atexit.register(world_pool.terminate)
+    return world_pool
+
+def init_world_worker():
+    # Let the main process deal with Ctrl-C
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+
+def worker_process_world(job):
+    """Run in a world pool process: process_world with a copy of the glyph's
+    budget. Returns the result, the level of detail reached and the stats
+    counted while doing so."""
+    task, budget_seconds, budget_start, options, em = job
+    budget = GlyphBudget(budget_seconds, budget_start)
+    context = RunContext(options, em)
+    result = process_world(task, budget, context)
+    return result, budget.lod, context.take_stats()
+
+def world_stages(result):
+    """The stages of one world, from process_world's result, with every
+    point as an (x, y) tuple (see stagefile.py)"""
+    def points(line):
+        return [(ux(p), uy(p)) for p in line]
+    return {
+        'rings': [points(any_to_polyline(result['line']))] + map(points, result['holes']),
+        'width': result['width'],
+        'triangles': map(triangle2threepoints, result['triangles']),
+        'edges': [map(points, triangle) for triangle in result['edges']],
+        'midpoints': map(points, result['midpoints']),
+        'midlines': map(points, result['midlines']),
+    }
+
+def extract_dots(contours, context, show_glyph=False, outline_cache=None, report=None):
+    """Calculate the dots for a list of FontForge contours with the context's
+    radius and spacing; see extract_midlines. Returns the dots in font units."""
+    midlines = extract_midlines(contours, context, show_glyph, outline_cache, report)
+    return dots_on_midlines(midlines, context.options)
+
+def extract_midlines(contours, context, show_glyph=False, outline_cache=None, report=None, stages=None):
+    """Calculate the midlines for a list of FontForge contours (such as a
+    glyph's foreground layer, which is a copy), scaling the contours in place
+    into the normalized coordinates of the context. Returns a list of
+    midlines, each a list of (x, y) points in font units; the dots only
+    depend on them and the radius and spacing (see dots_on_midlines).
+    If outline_cache (a dict) is given, glyphs whose outline is identical to
+    one seen before, apart from its position, get a moved copy of its midlines.
+    If report (a dict) is given, report['lod'] is set to the lowest level of
+    detail used (see LEVELS_OF_DETAIL), if that's not already lower.
+    If stages (a dict) is given, the results of each stage are put in it, in
+    normalized coordinates: 'outlines' (the flattened outlines and holes),
+    'triangles' (each three (x, y) points) and 'midlines', and 'worlds', the
+    stages of each outside polygon and its holes (see world_stages). Midlines
+    copied from the outline cache have no stages of their own; instead,
+    'copy_of' is (name of the glyph they were calculated for, x offset,
+    y offset), the offsets in normalized coordinates. The name is the one in
+    stages['glyphname'] when that glyph was calculated, if there was one."""
+    options = context.options
+    budget = GlyphBudget(options.glyph_budget)
+    if show_glyph:
         from visualization import (
-            setup_screen, draw_all, draw_midlines, red, green, blue, draw_fat_point,
+            setup_screen, draw_all, draw_midlines, draw_dots, show, red, green, blue,
         )
-    layer = glyph.foreground
     polylines = []
     polylines_to_draw = []
     alltriangles = []
-    allmidpoints = []
     allmidlines = []
-    dots = []
+    alldots = []
+    worlds = []
     # Calculate stroke width by first extracting vectors with no subdivision;
     # then convert to a Shapely polygon and calculate stroke width via the
     # 2*area / length algorithm. Then re-extract vectors with the real
     # stroke length.
     calculated_stroke_width = 0
-    # Extract vectors with the real stroke width now
-    approx_outlines = []
-    for contour in layer:
+    sane_contours = []
+    for contour in contours:
         if not is_sane_contour(contour):
             print("Skipping invalid contour:")
             debug_dump(contour)
             continue
-        scale_by(contour, args.scale_matrix)
+        scale_by(contour, context.scale_matrix)
+        sane_contours.append(contour)
+    contours = sane_contours
+    if not contours:
+        # Every empty outline (a space, or a composite with no contours of its
+        # own) is the same, but there's nothing to save by caching it
+        outline_cache = None
+    if outline_cache is not None and not show_glyph:
+        key, origin = outline_fingerprint(contours)
+        if key in outline_cache:
+            context.stats['outline cache hits'] += 1
+            cached_midlines, cached_origin, lod, source = outline_cache[key]
+            # The origins are in normalized coordinates; the midlines in font units
+            dx = (origin[0] - cached_origin[0]) / context.em_scale
+            dy = (origin[1] - cached_origin[1]) / context.em_scale
+            if report is not None:
+                report['lod'] = max(report.get('lod', 0), lod)
+            midlines = [[(ux(p) + dx, uy(p) + dy) for p in line] for line in cached_midlines]
+            if stages is not None:
+                stages['copy_of'] = (source, origin[0] - cached_origin[0], origin[1] - cached_origin[1])
+                stages['outlines'] = stages['triangles'] = stages['worlds'] = []
+                stages['midlines'] = [[(x * context.em_scale, y * context.em_scale) for x, y in line] for line in midlines]
+            return midlines
+        context.stats['outline cache misses'] += 1
+    # Extract vectors with the real stroke width now
+    approx_outlines = []
+    for contour in contours:
         points = extrapolate_midpoints(list(contour))
-        approx_vectors = extract_vectors(points)
+        approx_vectors = extract_vectors(points, tolerance = LEVELS_OF_DETAIL[budget.level()].curve_tolerance)
         linestring = vectorpairs_to_linestring(approx_vectors)
         approx_outlines.append((linestring, contour))
     approx_parent_data = calculate_parents(approx_outlines)
@@ -608,73 +1628,103 @@ def extract_dots(glyph, show_glyph=True):
     approx_level_data = calculate_immediate_children(approx_level_data)
     if show_glyph:
         screen = setup_screen()
-        args.screen = screen
     else:
         screen = None
-    for level in approx_level_data[::2]:
-        for polydata in level:
-            width = calculate_width(polydata)
-
-            # Recalculate the data['poly'] and data['line'] shapes,
-            # subdividing Beziers and vectors based on calculated width
-            recalculate_polys(polydata)
-
-            real_polyline = polydata['line']
-            real_polygon = polydata['poly']
-            polylines_to_draw.append(any_to_linestring(real_polyline))
-            children = polydata.get('immediatechildren', [])
-            triangles = make_triangles(polydata, children)
-            alltriangles.extend(triangles)
-            trianglelines = map(triangle2lines, triangles)
-            outside_polyline = any_to_polyline(real_polyline)
-            outside_polyline.append(outside_polyline[0])  # Close it
-            for line in pairwise(outside_polyline):
-                m = averagepoint_as_tuple(line[0], line[1])
-            holes = map(any_to_closedpolyline, [child['line'] for child in children])
-            for hole in holes:
-                for line in pairwise(hole):
-                    m = averagepoint_as_tuple(line[0], line[1])
-                polylines_to_draw.append(hole)
-            outlines_to_filter = [outside_polyline] + holes
-            real_trianglelines = list(filtertriangles(trianglelines, outlines_to_filter))
-            midpoints = list(itermap_stopatvectors(averagepoint_as_tuplevector, real_trianglelines))
-            midlines = list(calculate_midlines(midpoints))
-            dots.extend(calculate_dots(midlines, args.radius, args.spacing))
-            if show_glyph and args.show_dots:
-                for dot in dots:
-                    draw_fat_point(screen, dot, args.em, args.zoom, args.radius, color = blue)
-            # Structure of midpoints now:
-            # [t1, t2, t3] where t1, t2, t3 are: [m1, m2, m3] or [m1, m2] or [m1]
-            # And m1, m2, m3 are (x, y)
-            # Basically, each triangle's vectors have been changed to midpoints,
-            # but the structure still remains
-            for t in midpoints:
-                if len(t) == 1:
-                    for m in t:
-                        pass
-            allmidpoints.extend(midpoints)
-            allmidlines.extend(map(vectorpairs_to_pointlist, midlines))
-            #break  # Uncomment this to draw only the first "world"
+    # Each outside polygon, with its holes, is a separate "world" that can be
+    # processed independently of the others
+    tasks = [world_task(polydata) for level in approx_level_data[::2] for polydata in level]
+    if options.world_jobs > 1 and len(tasks) > 1 and not multiprocessing.current_process().daemon:
+        jobs = [(task, budget.seconds, budget.start, options, context.em) for task in tasks]
+        results = []
+        # pool.map returns the results in the same order as the tasks
+        for result, lod, stats in get_world_pool(options.world_jobs).map(worker_process_world, jobs):
+            results.append(result)
+            budget.lod = max(budget.lod, lod)
+            context.stats.update(stats)
+    else:
+        results = (process_world(task, budget, context) for task in tasks)
+    for result in results:
+        if result is None:
+            continue
+        polylines_to_draw.append(any_to_linestring(result['line']))
+        polylines_to_draw.extend(result['holes'])
+        alltriangles.extend(result['triangles'])
+        if show_glyph and options.show_dots:
+            alldots.extend(calculate_dots(result['midlines'], options.radius * context.em_scale, options.spacing))
+        allmidlines.extend(result['midlines'])
+        if stages is not None:
+            worlds.append(world_stages(result))
+        #break  # Uncomment this to draw only the first "world"
 
     if show_glyph:
-        draw_all(screen, polylines_to_draw, [], alltriangles, emsize = args.em, zoom = args.zoom,
-            polylinecolor = (blue if args.show_glyph else None),
-            trianglecolor = (red if args.show_triangles else None))
-    if args.show_lines:
-        draw_midlines(screen, allmidlines, allmidpoints, emsize = args.em, zoom = args.zoom, polylinecolor = green)
-    return dots
+        # Draw the whole glyph, then update the screen once
+        rects = draw_dots(screen, alldots, context.geometry_em, options.zoom, options.radius * context.em_scale,
+            color = blue, update = False)
+        rects += draw_all(screen, polylines_to_draw, [], alltriangles, emsize = context.geometry_em, zoom = options.zoom,
+            polylinecolor = (blue if options.show_glyph else None),
+            trianglecolor = (red if options.show_triangles else None), update = False)
+        if options.show_lines:
+            rects += draw_midlines(screen, allmidlines, emsize = context.geometry_em, zoom = options.zoom,
+                polylinecolor = green, update = False)
+        show(rects)
+    # Back from normalized coordinates to font units
+    midlines = [[(ux(p) / context.em_scale, uy(p) / context.em_scale) for p in line] for line in allmidlines]
+    if outline_cache is not None and not show_glyph:
+        source = stages.get('glyphname') if stages is not None else None
+        outline_cache[key] = (midlines, origin, budget.lod, source)
+    if report is not None:
+        report['lod'] = max(report.get('lod', 0), budget.lod)
+    if stages is not None:
+        stages['outlines'] = [list(any_to_polyline(line)) for line in polylines_to_draw]
+        stages['triangles'] = map(triangle2threepoints, alltriangles)
+        stages['midlines'] = allmidlines
+        stages['worlds'] = worlds
+    return midlines
+
+def journal_settings(fname, options):
+    """Everything that affects the midlines a run produces, so that a journal
+    from a run with different settings is never resumed from. (The radius and
+    spacing only affect the dots placed on the midlines afterwards.)"""
+    stat = os.stat(fname)
+    return [os.path.abspath(fname), stat.st_size, int(stat.st_mtime),
+        options.scale, options.minstrokewidth, options.maxstrokewidth,
+        options.repair, options.repair_epsilon, options.max_vertices, options.decimate_tolerance,
+        options.max_edge_factor, options.normalize_em, options.glyph_budget]
+
+# Circles centered on (0, 0), by (radius, is_quadratic); see dot_template
+dot_templates = {}
+
+def dot_template(radius, is_quadratic):
+    """Return a circle contour of the given radius centered on (0, 0), to be
+    copied and moved into place for each dot. Making the circle from scratch
+    for every dot is a noticeable part of the time taken by large fonts."""
+    key = (radius, is_quadratic)
+    template = dot_templates.get(key)
+    if template is None:
+        template = circle_at((0, 0), size=radius)
+        template.is_quadratic = is_quadratic
+        dot_templates[key] = template
+    return template
 
-def copy_glyph(orig_glyph, new_glyph):
+def copy_glyph(orig_glyph, new_glyph, options, dots = None):
     new_glyph.width = orig_glyph.width
     new_glyph.vwidth = orig_glyph.vwidth
-    dots = extract_dots(orig_glyph, args.visualize)
+    if dots is None:
+        context = RunContext(options, orig_glyph.font.em)
+        dots = extract_dots(orig_glyph.foreground, context, options.visualize)
+    # glyph.foreground is a copy, so build the whole layer and then set it
+    # once, rather than copying the layer back and forth for every dot
+    layer = fontforge.layer()
+    layer.is_quadratic = new_glyph.foreground.is_quadratic
+    template = dot_template(options.radius, layer.is_quadratic)
     for dot in dots:
-        contour = circle_at(dot, size=args.radius)
-        contour.is_quadratic = new_glyph.foreground.is_quadratic
-        new_glyph.foreground += contour
+        contour = template.dup()
+        contour.transform((1, 0, 0, 1, ux(dot), uy(dot)))
+        layer += contour
+    new_glyph.foreground = layer
     for anchor in orig_glyph.anchorPoints:
         new_glyph.addAnchorPoint(*anchor)
-    if args.copy_bearings:
+    if options.copy_bearings:
         new_glyph.left_side_bearing = orig_glyph.left_side_bearing
         new_glyph.right_side_bearing = orig_glyph.right_side_bearing
     return new_glyph  # Probably not needed as the font now contains it
@@ -708,34 +1758,193 @@ def make_triangles_unsafe(polygon_data, holes = None):
     triangles.extend(cdt.triangulate())
     return triangles
 
-def make_triangles(polygon_data, holes = None, timeout = 3.0):
+# Model of how long a triangulation may take before we decide it's stuck.
+# poly2tri's running time grows roughly linearly with the number of vertices,
+# plus a cost per hole; these constants are measured times (see
+# "python benchmark.py timeouts") multiplied by a wide safety margin.
+TIMEOUT_BASE = 0.25
+TIMEOUT_PER_VERTEX = 0.0005
+TIMEOUT_PER_HOLE = 0.02
+
+# How long a new triangulation worker may take to start (Python, fontforge
+# and p2t all have to be imported) before it's taken to be broken
+STARTUP_TIMEOUT = 30.0
+
+def triangulation_timeout(numvertices, numholes):
+    """How long (in seconds) to wait for a polygon with this many vertices and
+    holes to be triangulated before giving up on it."""
+    return TIMEOUT_BASE + TIMEOUT_PER_VERTEX * numvertices + TIMEOUT_PER_HOLE * numholes
+
+class TriangulationWorker(object):
+    """A make_triangles.py process that stays running between polygons, so
+    Python and p2t don't have to start up again for each one. A spare process
+    is kept ready, so that when a polygon hangs and its process has to be
+    killed, the next attempt doesn't have to wait for a new one to start.
+    Each process says when it has started up, and a polygon's timeout only
+    starts once its process is ready. After a failed triangulate(), failure
+    is 'timeout' if the polygon took too long, or 'died' if the process died
+    (or never started), and elapsed is how many seconds were spent on it."""
+    script = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'make_triangles.py')
+
+    def __init__(self):
+        self.pid = os.getpid()
+        self.devnull = open(os.devnull, 'w')
+        self.process = self.start()
+        self.spare = self.start()
+        self.failure = None
+        self.elapsed = 0.0
+        # Both processes start up at the same time; wait for the first now
+        self.wait_until_ready()
+
+    def start(self):
+        process = subprocess32.Popen(
+                ['python', self.script, '--serve'],
+                stdin=subprocess32.PIPE,
+                stdout=subprocess32.PIPE,
+                stderr=self.devnull)
+        process.ready = False
+        return process
+
+    def wait_until_ready(self):
+        """Wait for the current process's "READY" line (see make_triangles.py
+        --serve). Returns False if it died or took longer than STARTUP_TIMEOUT."""
+        process = self.process
+        if process.ready:
+            return True
+        deadline = time.time() + STARTUP_TIMEOUT
+        fd = process.stdout.fileno()
+        out = ""
+        while not out.endswith("READY\n"):
+            remaining = deadline - time.time()
+            if remaining <= 0:
+                return False
+            ready, _, _ = select.select([fd], [], [], remaining)
+            if not ready:
+                continue
+            # Nothing else is written before the first polygon is sent
+            chunk = os.read(fd, 65536)
+            if not chunk:
+                return False
+            out += chunk
+        process.ready = True
+        return True
+
+    def replace(self):
+        """Kill the current process and switch to the spare one"""
+        if self.process.poll() is None:
+            self.process.kill()
+        self.process.wait()
+        self.process = self.spare
+        self.spare = self.start()
+
+    def triangulate(self, process_input, timeout):
+        """Send a polygon (in make_triangles.py's input format) to the worker.
+        Returns the worker's output lines, or None if it took longer than
+        timeout seconds or died (see failure and elapsed)."""
+        start = time.time()
+        self.failure = None
+        # A process that died after its last polygon (e.g. p2t segfaulted as
+        # it finished) is replaced, and the polygon sent to the next one
+        for tries in range(2):
+            if not self.wait_until_ready():
+                return self.failed('died', start)
+            try:
+                self.process.stdin.write(process_input + "\nEND\n")
+                self.process.stdin.flush()
+                break
+            except IOError:
+                self.replace()
+        else:
+            return self.failed('died', start)
+        deadline = time.time() + timeout
+        fd = self.process.stdout.fileno()
+        out = ""
+        while not (out == "END\n" or out.endswith("\nEND\n")):
+            remaining = deadline - time.time()
+            if remaining <= 0:
+                return self.failed('timeout', start)
+            ready, _, _ = select.select([fd], [], [], remaining)
+            if not ready:
+                continue
+            chunk = os.read(fd, 65536)
+            if not chunk:
+                return self.failed('died', start)
+            out += chunk
+        self.elapsed = time.time() - start
+        return out.splitlines()[:-1]
+
+    def failed(self, failure, start):
+        """Give up on the current polygon, switching to the spare process"""
+        self.replace()
+        self.failure = failure
+        self.elapsed = time.time() - start
+        return None
+
+    def close(self):
+        for process in (self.process, self.spare):
+            process.stdin.close()
+            process.wait()
+
+# Each thread has a TriangulationWorker of its own, since a worker can only
+# handle one polygon at a time
+triangulation_workers = threading.local()
+
+def get_triangulation_worker():
+    """Return this thread's TriangulationWorker, starting it if needed. (A
+    worker inherited from a parent process over fork() can't be shared.)"""
+    worker = getattr(triangulation_workers, 'worker', None)
+    if worker is None or worker.pid != os.getpid():
+        worker = triangulation_workers.worker = TriangulationWorker()
+        atexit.register(worker.close)
+    return worker
+
+def make_triangles(polygon_data, holes = None, timeout = None, max_timeout = None, stats = None):
     """This function takes a dictionary, and an optional holes parameter
     that determines the holes of a polyline, and tesselates the polyline
     into triangles. This is an intermediate step to calculating the midpoints.
     NOTE: Because this step can sometimes be thrown into an infinite loop by
     some badly-designed glyphs, the timeout parameter (in seconds) indicates
-    how long to wait for the triangulation step to finish."""
+    how long to wait for the triangulation step to finish. If not given, it's
+    calculated from the size of the polygon by triangulation_timeout. When
+    the triangulation times out, it's retried with near-duplicate vertices
+    removed, and then with every vertex moved by a tiny amount, since either
+    of those is usually enough to get poly2tri out of its infinite loop.
+    If every attempt fails, returns None. max_timeout, if given, caps the
+    calculated timeout (for glyphs that are running out of time budget).
+    Timeouts are counted in stats (a Counter), if given."""
     if holes is None:
         holes = []
     triangles = []
-    polyline = any_to_polyline(polygon_data['line'])
-    converted_holes = list(any_to_polyline(hole['line']) for hole in holes)
-    process_input = "\n".join(str(p) for p in polyline)
-    for hole in converted_holes:
-        process_input += "\nHOLE:\n"
-        process_input += "\n".join(str(p) for p in hole)
-    process = subprocess32.Popen(
-            ['python', 'make_triangles.py'],
-            stdin=subprocess32.PIPE,
-            stdout=subprocess32.PIPE,
-            stderr=subprocess32.PIPE)
-    try:
-        out, err = process.communicate(process_input, timeout)
-    except subprocess32.TimeoutExpired:
-        process.kill()
-        print("WARNING: Glyph processing failed for this glyph.")
-        out, err = process.communicate()
-    for line in out.splitlines():
+    polyline = list(any_to_polyline(polygon_data['line']))
+    converted_holes = list(list(any_to_polyline(hole['line'])) for hole in holes)
+    if timeout is None:
+        numvertices = len(polyline) + sum(len(hole) for hole in converted_holes)
+        timeout = triangulation_timeout(numvertices, len(converted_holes))
+    if max_timeout is not None:
+        timeout = min(timeout, max_timeout)
+    attempts = [
+        lambda line: line,
+        remove_near_duplicates,
+        jitter_polyline,
+    ]
+    worker = get_triangulation_worker()
+    for attempt in attempts:
+        process_input = "\n".join(str(p) for p in attempt(polyline))
+        for hole in converted_holes:
+            process_input += "\nHOLE:\n"
+            process_input += "\n".join(str(p) for p in attempt(hole))
+        out = worker.triangulate(process_input, timeout)
+        if out is not None:
+            break
+        if stats is not None and worker.failure == 'timeout':
+            stats['triangulation timeouts'] += 1
+            stats['seconds lost to timeouts'] += timeout
+        elif stats is not None:
+            stats['triangulation worker deaths'] += 1
+            stats['seconds lost to worker deaths'] += worker.elapsed
+    else:
+        return None
+    for line in out:
         # Each output line is [(ax,ay), (bx,by), (cx,cy)]
         parts = line.strip().lstrip('[').rstrip(']').split(',')
         if len(parts) != 6:
@@ -753,8 +1962,16 @@ def debug(s, *args, **kwargs):
     else:
         print(s.format(*args, **kwargs))
 
-def parse_args():
-    "Parse the arguments the user passed in"
+def parse_variant(spec):
+    "Parse a --variant option: RADIUS:SPACING:OUTPUT"
+    try:
+        radius, spacing, output = spec.split(':', 2)
+        return float(radius), float(spacing), output
+    except ValueError:
+        raise argparse.ArgumentTypeError("expected RADIUS:SPACING:OUTPUT, got {!r}".format(spec))
+
+def parse_args(argv = None):
+    "Parse the arguments the user passed in (or the given list of arguments)"
     parser = argparse.ArgumentParser(description = textwrap.dedent("""
         This software creates a dotted font from any given input font. After creating
         the dotted font, you'll want to edit it by hand in FontForge to change the
@@ -777,7 +1994,9 @@ def parse_args():
     parser.add_argument('-v', '--verbose', action = "store_true", help = "Give more verbose error messages")
     parser.add_argument("inputfilename", nargs = "?", default = None, help = "Required: Font file (SFD or TTF format)")
     parser.add_argument("glyphname", nargs = "?", default = None, help = "Optional: Codepoint to render (in U+89AB form)")
-    parser.add_argument('-o', '--output', action = "store", default = "output.ttf", help = "Filename of output dotted TTF")
+    parser.add_argument('-o', '--output', action = "append", default = None, help = "Filename of output dotted TTF (or any format FontForge can write, e.g. .otf, .woff2, .sfd, or a .ufo directory); give -o more than once to write the same font in several formats (default output.ttf)")
+    parser.add_argument('--contact-sheet', action = "store", default = None, metavar = "DIRECTORY", help = "Instead of making a dotted font, draw every glyph's outline, triangles, midlines and dots into PNG contact sheets in DIRECTORY (needs pygame, but no display)")
+    parser.add_argument('--save-stages', action = "store", default = None, metavar = "DIRECTORY", help = "Save what each stage of the pipeline made of every glyph into a file per glyph in DIRECTORY, to look at later with replay.py (see stagefile.py)")
     parser.add_argument('-z', '--zoom', action = "store", type = float, default = 1.0, help = "Zoom level of visualization (default 1.0)")
     parser.add_argument('-m', '--minstrokewidth', action = "store", type = float, default = 1, help = "Used for fine-tuning results (advanced usage only)")
     parser.add_argument('-M', '--maxstrokewidth', action = "store", type = float, default = 1e100, help = "Used for fine-tuning results (advanced usage only)")
@@ -787,11 +2006,36 @@ def parse_args():
     parser.add_argument('-g', '--show-glyph', action = "store_true", help = "Show the glyph outline")
     parser.add_argument('-r', '--radius', action = "store", type = float, default = 12, help = "Radius of dots, in em units (default 12)")
     parser.add_argument('-s', '--spacing', action = "store", type = float, default = 6.0, help = "Spacing of dots, as a multiple of dot radius (default 6.0 for 600%%)")
+    parser.add_argument('--variant', action = "append", type = parse_variant, default = [], dest = "variants", metavar = "RADIUS:SPACING:OUTPUT", help = "Also write OUTPUT with this dot radius and spacing, placing its dots on the same midlines (may be given more than once)")
+    target = parser.add_mutually_exclusive_group()
+    target.add_argument('--target-dots', action = "store", type = float, default = None, metavar = "N", help = "Choose the spacing (instead of -s) that gives about N dots per glyph")
+    target.add_argument('--target-density', action = "store", type = float, default = None, metavar = "N", help = "Choose the spacing (instead of -s) that gives about N dots per em of midline")
+    target.add_argument('--target-gap', action = "store", type = float, default = None, metavar = "UNITS", help = "Choose the spacing (instead of -s) that leaves this much space between neighbouring dots, in em units (0 for dots that just touch)")
+    parser.add_argument('--target-per-glyph', action = "store_true", help = "Choose a spacing for each glyph separately to meet the --target-* option, instead of one for the whole font")
+    parser.add_argument('--prune-distance', action = "store", type = float, default = 0.5, metavar = "FRACTION", help = "Drop dots closer than this fraction of the dot radius to another dot, keeping the dots at the ends of lines; 0 to keep them all (default 0.5)")
     parser.add_argument('-S', '--scale', action = "store", type = float, default = 1.0, help = "How much to scale the original font before making dotted version (0.5 means 50%%, 2.0 means 200%%) (default 1.0 for 100%%)")
     parser.add_argument('-b', '--copy-bearings', action = "store_true", help = "Copy left/right side bearings of glyphs to new font (default is to calculate them automatically, use this to copy them from the old font instead)")
+    parser.add_argument('--writer', action = "store", choices = ('fontforge', 'direct'), default = 'fontforge', help = "How to write the output font: 'direct' writes TrueType glyph tables itself and copies the rest of a TTF input file unchanged, which is much faster for large fonts; other fonts are written by FontForge anyway (default fontforge)")
+    parser.add_argument('--in-place', action = "store_true", help = "Make the dotted glyphs in the input font that's already open and write that, instead of copying the font file and opening the copy; saves time and memory for large fonts")
     parser.add_argument('-n', '--font-name', action = "store", type = str, default = "", help = "New font name (REQUIRED if you plan to distribute this font to others, as the default is to use \"(orignal name) Dotted\", which is NOT OFL-compliant)")
-    args = parser.parse_args()
-    args.visualize = (args.show_triangles or args.show_lines or args.show_dots or args.show_glyph)
+    parser.add_argument('--text', action = "store", default = None, help = "Only build the glyphs needed to render this text (UTF-8)")
+    parser.add_argument('--unicodes', action = "store", default = None, help = "Only build the glyphs for these codepoints, e.g. U+0041-005A,U+00C0-00FF")
+    parser.add_argument('--glyphs', action = "store", default = None, help = "Only build these glyphs (comma-separated glyph names)")
+    parser.add_argument('--normalize-em', action = "store", type = float, default = 1000, help = "Calculate the dots in a coordinate space with this many units per em, whatever the font's em size, so that processing time doesn't grow with it; 0 to use the font's own units (default 1000)")
+    parser.add_argument('--no-repair', action = "store_false", dest = "repair", help = "Don't clean up outlines (duplicate points, spikes, touching rings) before triangulating them")
+    parser.add_argument('--repair-epsilon', action = "store", type = float, default = 0.5, help = "Points closer than this (in normalized units, see --normalize-em) count as touching when cleaning up outlines (default 0.5)")
+    parser.add_argument('--max-vertices', action = "store", type = int, default = None, help = "Simplify each flattened contour to at most this many points before triangulating it")
+    parser.add_argument('--decimate-tolerance', action = "store", type = float, default = None, help = "Simplify flattened contours by dropping points less than this far (in normalized units, see --normalize-em) from a straight line")
+    parser.add_argument('--max-edge-factor', action = "store", type = float, default = 2.0, help = "When simplifying contours, keep edges no longer than this multiple of the stroke width (default 2.0)")
+    parser.add_argument('--glyph-budget', action = "store", type = float, default = None, metavar = "SECONDS", help = "Time allowed per glyph: glyphs that run short of time are finished at a lower level of detail instead of failing")
+    parser.add_argument('-j', '--jobs', action = "store", type = int, default = 1, help = "Number of glyphs to process in parallel (default 1)")
+    parser.add_argument('--world-jobs', action = "store", type = int, default = 1, help = "Number of processes to share the separate parts of a single glyph between (default 1); most useful with a glyph name given, for large glyphs")
+    parser.add_argument('--stats', action = "store", default = None, help = "JSON file of per-glyph reports (time taken, level of detail used): read to plan the order glyphs are processed in, and updated at the end of the run")
+    parser.add_argument('--resume', action = "store_true", help = "Continue an interrupted run, skipping the glyphs already recorded in the output's .journal file")
+    parser.add_argument('--checkpoint-every', action = "store", type = int, default = 50, help = "Flush finished glyphs to the .journal file every N glyphs (default 50)")
+    args = parser.parse_args(argv)
+    if not args.output:
+        args.output = ["output.ttf"]
     if args.inputfilename is None:
         parser.print_help()
     return args
@@ -802,18 +2046,27 @@ def calculate_matrix(scale):
     else:
         return psMat.scale(scale)
 
+def confirm_font_name(new_familyname):
+    print("WARNING: New font name \"{}\" does NOT comply with the Open Font License!!".format(new_familyname))
+    print("Please press Enter to proceed anyway, or Ctrl-C to exit.")
+    print("By proceeding, you acknowledge that you do NOT intend to distribute this font to anyone else.")
+    raw_input()
+
 def main():
     """This is the main function we use that calls extraction_demo and also runs
     a sanity check to make sure everything works properly."""
-    global args
     args = parse_args()
     if args.inputfilename is None:
         return 2
-    args.scale_matrix = calculate_matrix(args.scale)
-    if args.glyphname is None:
-        create_dotted_font(args.inputfilename)
+    options = Options.from_args(args)
+    if args.contact_sheet:
+        stats = draw_contact_sheets(args.inputfilename, args.contact_sheet, options)
+        print_run_summary(stats)
+    elif args.glyphname is None:
+        stats = dot_font(args.inputfilename, args.output, options, confirm_font_name, args.variants)
+        print_run_summary(stats)
     else:
-        extraction_demo(args.inputfilename, args.glyphname)
+        extraction_demo(args.inputfilename, args.glyphname, options)
     return 0
 
 if __name__ == "__main__":
@@ -7,6 +7,7 @@ operations (like averagepoint or pairwise) go in this library.
 """
 import itertools
 import functools
+import collections
 import fontforge
 import psMat
 import math
@@ -53,6 +54,59 @@ def scale_by(contour, scale_matrix):
     if scale_matrix is not None:
         contour.transform(scale_matrix)
 
+def remove_near_duplicates(polyline, epsilon = 0.5):
+    """Takes a polyline (list of (x, y) tuples) and drops every point that is
+    within epsilon of the last point kept. The closing point of a closed
+    polyline is treated the same way."""
+    result = []
+    for p in polyline:
+        if result and vectorlength(p, result[-1]) < epsilon:
+            continue
+        result.append(p)
+    while len(result) > 1 and vectorlength(result[-1], result[0]) < epsilon:
+        del result[-1]
+    return result
+
+def jitter_polyline(polyline, amount = 1e-3, seed = 0):
+    """Takes a polyline (list of (x, y) tuples) and moves each point by a tiny
+    amount (at most `amount` in x and y). The offsets are deterministic: the
+    same polyline and seed always give the same result."""
+    result = []
+    for i, p in enumerate(polyline):
+        # Cheap deterministic pseudo-random offsets in [-1, 1]
+        fx = (((i + seed) * 7919) % 17) / 8.0 - 1.0
+        fy = (((i + seed) * 104729) % 19) / 9.0 - 1.0
+        result.append((ux(p) + fx * amount, uy(p) + fy * amount))
+    return result
+
+def prune_close_dots(dots, min_distance, priority = None):
+    """Takes a list of dots ((x, y) tuples) and drops every dot that is closer
+    than min_distance to a dot that's been kept, so that dots don't pile up on
+    top of each other. Dots with a higher priority (a list with a number for
+    each dot) are kept in preference to the others, and otherwise earlier dots
+    are. Returns the dots that are kept, in their original order."""
+    if min_distance <= 0 or len(dots) < 2:
+        return list(dots)
+    if priority is None:
+        order = range(len(dots))
+    else:
+        # sorted() is stable, so dots of the same priority stay in order
+        order = sorted(range(len(dots)), key = lambda i: -priority[i])
+    # Spatial hash with cells of size min_distance: any dot that's too close
+    # is in the same or a neighbouring cell
+    cells = collections.defaultdict(list)
+    kept = [False] * len(dots)
+    for i in order:
+        p = dots[i]
+        cx, cy = int(math.floor(ux(p) / min_distance)), int(math.floor(uy(p) / min_distance))
+        if any(vectorlength(dots[j], p) < min_distance
+               for dx in (-1, 0, 1) for dy in (-1, 0, 1)
+               for j in cells.get((cx + dx, cy + dy), ())):
+            continue
+        kept[i] = True
+        cells[(cx, cy)].append(i)
+    return [dot for dot, keep in zip(dots, kept) if keep]
+
 def debug_dump(contour):
     print(", ".join(str((ux(p), uy(p))) for p in contour))
 
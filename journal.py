@@ -0,0 +1,118 @@
+from __future__ import division, print_function
+
+"""Library for checkpointing long font runs
+
+A journal is a text file, kept next to the output font, that records the
+midlines found for each glyph as soon as that glyph is finished. If a run is killed
+part-way through, running again with --resume reads the journal back and only
+processes the glyphs that aren't in it yet.
+
+Journal format: one JSON list per line. The first line is a header holding the
+settings of the run that wrote the journal; every later line is
+    [glyphname, [[x1, y1, x2, y2, ...], [x1, y1, ...], ...]]
+with one list of coordinates per midline. Floats are written with repr(), so
+midlines read back from the journal are exactly the ones that were calculated,
+and a resumed run produces the same font as an uninterrupted one.
+"""
+
+import json
+import os
+import sys
+from generalfuncs import ux, uy
+
+JOURNAL_VERSION = 2
+
+class GlyphJournal(object):
+    """Append-only record of finished glyphs.
+
+    If resume is true and an existing journal at path was written with the
+    same settings, its glyphs are loaded and new glyphs are appended to it.
+    Otherwise any existing journal is discarded and a fresh one started.
+    The journal is flushed to disk every checkpoint_every glyphs."""
+    def __init__(self, path, settings, resume = False, checkpoint_every = 50):
+        self.path = path
+        self.header = ['fontinline-journal', JOURNAL_VERSION, settings]
+        self.checkpoint_every = max(int(checkpoint_every), 1)
+        self.completed = {}
+        self.unsaved = 0
+        if resume and os.path.exists(path):
+            good_length = self.load()
+        if self.completed:
+            # Cut off any partial line left by a crash before appending to it
+            self.f = open(path, 'r+')
+            self.f.truncate(good_length)
+            self.f.seek(good_length)
+        else:
+            self.f = open(path, 'w')
+            self.f.write(json.dumps(self.header) + "\n")
+            self.sync()
+
+    def load(self):
+        """Read finished glyphs from an existing journal. Returns the length
+        in bytes of the part of the file that was read successfully."""
+        with open(self.path) as f:
+            lines = f.readlines()
+        try:
+            header = json.loads(lines[0])
+        except (ValueError, IndexError):
+            header = None
+        # Round-trip our own header through JSON so that tuples and lists compare equal
+        if header != json.loads(json.dumps(self.header)):
+            print("WARNING: Journal {} was written with different settings; starting over.".format(self.path))
+            return 0
+        good_length = len(lines[0])
+        for line in lines[1:]:
+            try:
+                glyphname, coords_list = json.loads(line)
+            except ValueError:
+                # The last line may be incomplete if the previous run crashed mid-write
+                break
+            if not line.endswith("\n"):
+                break
+            self.completed[glyphname] = [list(zip(coords[0::2], coords[1::2])) for coords in coords_list]
+            good_length += len(line)
+        return good_length
+
+    def __len__(self):
+        return len(self.completed)
+
+    def __contains__(self, glyphname):
+        return glyphname in self.completed
+
+    def get(self, glyphname, default = None):
+        """Return the midlines recorded for glyphname, as lists of (x, y) tuples"""
+        return self.completed.get(glyphname, default)
+
+    def record(self, glyphname, midlines):
+        lines = []
+        for midline in midlines:
+            coords = []
+            for p in midline:
+                coords.append(ux(p))
+                coords.append(uy(p))
+            lines.append(coords)
+        self.f.write(json.dumps([glyphname, lines], separators = (',', ':')) + "\n")
+        self.completed[glyphname] = [list(zip(coords[0::2], coords[1::2])) for coords in lines]
+        self.unsaved += 1
+        if self.unsaved >= self.checkpoint_every:
+            self.sync()
+
+    def sync(self):
+        """Make sure everything recorded so far would survive a crash"""
+        self.f.flush()
+        os.fsync(self.f.fileno())
+        self.unsaved = 0
+
+    def close(self):
+        if not self.f.closed:
+            self.sync()
+            self.f.close()
+
+    def remove(self):
+        """Delete the journal; called once the output font has been written"""
+        self.close()
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+if __name__ == '__main__':
+    sys.stderr.write('Please run extractpoints.py, not this file.\n')
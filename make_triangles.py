@@ -26,10 +26,15 @@ def make_triangles(polyline, holes = None):
     triangles.extend(cdt.triangulate())
     return list(triangle2threepoints(t) for t in triangles)
 
-def parse_input():
+def parse_input(lines = None):
+    """Parse polygon lines as written by extractpoints.make_triangles: one
+    (x, y) point per line, with a "HOLE:" line before each hole. If lines is
+    not given, they are read from stdin (or the files named on the command line)."""
+    if lines is None:
+        lines = fileinput.input()
     result = []
     points = []
-    for line in fileinput.input():
+    for line in lines:
         line = line.strip().lstrip('(').rstrip(')')
         if line == "HOLE:":
             result.append(points)
@@ -45,7 +50,39 @@ def parse_input():
         result.append(points)
     return result
 
+def serve():
+    """Triangulate one polygon after another, so that the process (and the p2t
+    import) can be reused. Each polygon is in the same format as for
+    parse_input, followed by an "END" line; each answer is the list of
+    triangles, one per line, followed by an "END" line. Once p2t has been
+    imported, a "READY" line is written, so that the caller doesn't count
+    the start-up time against the first polygon's timeout."""
+    import_p2t()
+    print("READY")
+    sys.stdout.flush()
+    lines = []
+    while True:
+        line = sys.stdin.readline()
+        if not line:
+            return 0
+        if line.strip() != "END":
+            lines.append(line)
+            continue
+        line_and_holes = parse_input(lines)
+        lines = []
+        try:
+            if line_and_holes:
+                for triangle in make_triangles(line_and_holes[0], line_and_holes[1:]):
+                    print(triangle)
+        except Exception as e:
+            # Report the failure as "no triangles" and stay alive for the next polygon
+            sys.stderr.write("Triangulation failed: {}\n".format(e))
+        print("END")
+        sys.stdout.flush()
+
 def main(argv):
+    if '--serve' in argv[1:]:
+        return serve()
     line_and_holes = parse_input()
     if len(line_and_holes) < 1:
         return 1  # No data received!
@@ -0,0 +1,170 @@
+#!/usr/bin/env python
+
+from __future__ import division, print_function
+
+"""Show the stages of glyphs saved by extractpoints.py --save-stages
+
+Draws a glyph's outline, triangles, the triangle edges kept for the midlines,
+their midpoints, the midlines and the dots straight from the saved files (see
+stagefile.py), without the font or any of the pipeline being run again. A composite glyph
+whose references were reused, or an outline copied from an identical one, is
+drawn whole from the files of the glyphs it came from (see
+stagefile.load_whole_stages):
+
+    t e p l d g  show or hide the triangles, edges, midpoints, midlines,
+                 dots or outline
+    w / W        show only the next / previous world (outside polygon and
+                 its holes), then all of them again
+    Right, Space next file
+    Left, Backsp previous file
+    q, Escape    quit
+
+For example:
+
+    python extractpoints.py inputfont.ttf -o dots.ttf --save-stages stages/
+    python replay.py stages/A_.stages stages/uni1000.stages
+    python replay.py stages/*.stages --summary
+    python replay.py stages/*.stages --contact-sheet sheets/
+
+--summary only prints how big each stage is, and --contact-sheet draws the
+files into PNG contact sheets (as extractpoints.py --contact-sheet does)
+instead of opening a window.
+"""
+
+import argparse
+import os
+import sys
+import stagefile
+
+# What each key shows or hides, and the color it's drawn in (by name, from
+# the visualization module)
+STAGE_KEYS = [
+    ('t', 'triangles', 'red'),
+    ('e', 'edges', 'pink'),
+    ('p', 'midpoints', 'black'),
+    ('l', 'midlines', 'green'),
+    ('d', 'dots', 'blue'),
+    ('g', 'rings', 'blue'),
+]
+
+def world_items(stages, name, world):
+    """A per-world stage, for all the worlds or just one (by number)"""
+    worlds = stages[name]
+    if world is not None:
+        worlds = worlds[world:world + 1]
+    return [item for items in worlds for item in items]
+
+def draw_stages(screen, stages, shown, zoom = 1.0, world = None):
+    """Draw the chosen stages of a loaded stages file, filling the screen"""
+    import visualization
+    em = stages['geometry_em']
+    scale = stages['em_scale']
+    # Fit 1.5 em on the screen, with room for descenders
+    zoom = zoom * screen.get_size()[1] / (1.5 * em)
+    emsize = 1.25 * em
+    colors = dict((name, getattr(visualization, color)) for key, name, color in STAGE_KEYS)
+    if 'triangles' in shown:
+        visualization.draw_all(screen, [], [], world_items(stages, 'triangles', world), emsize, zoom,
+            polylinecolor = None, holecolor = None, trianglecolor = colors['triangles'], update = False)
+    if 'edges' in shown:
+        edges = [edge for triangle in world_items(stages, 'edges', world) for edge in triangle]
+        visualization.draw_midlines(screen, edges, emsize, zoom, polylinecolor = colors['edges'], update = False)
+    if 'rings' in shown:
+        visualization.draw_all(screen, world_items(stages, 'rings', world), [], [], emsize, zoom,
+            polylinecolor = colors['rings'], update = False)
+    if 'midlines' in shown:
+        visualization.draw_midlines(screen, world_items(stages, 'midlines', world), emsize, zoom,
+            polylinecolor = colors['midlines'], update = False)
+    if 'midpoints' in shown:
+        midpoints = [point for triangle in world_items(stages, 'midpoints', world) for point in triangle]
+        visualization.draw_dots(screen, midpoints, emsize, zoom, 1.5 / zoom, color = colors['midpoints'], update = False)
+    if 'dots' in shown:
+        visualization.draw_dots(screen, [(x * scale, y * scale) for x, y in stages['dots']], emsize, zoom,
+            stages['options']['radius'] * scale, color = colors['dots'], update = False)
+
+def sheet_stages(stages):
+    """A loaded stages file in the form visualization.ContactSheets draws"""
+    scale = stages['em_scale']
+    return {
+        'outlines': world_items(stages, 'rings', None),
+        'triangles': world_items(stages, 'triangles', None),
+        'midlines': world_items(stages, 'midlines', None),
+        'dots': [(x * scale, y * scale) for x, y in stages['dots']],
+        'radius': stages['options']['radius'] * scale,
+    }
+
+def draw_contact_sheets(filenames, directory):
+    import visualization
+    if not os.path.isdir(directory):
+        os.makedirs(directory)
+    sheets = None
+    for filename in filenames:
+        stages = stagefile.load_whole_stages(filename)
+        if sheets is None:
+            sheets = visualization.ContactSheets(directory, stages['geometry_em'])
+        sheets.add(stages['glyph'], sheet_stages(stages))
+    if sheets is not None:
+        sheets.close()
+        print("{} glyphs drawn on {} contact sheets in {}".format(len(filenames), sheets.pages, directory))
+
+def show_stages(filenames, zoom = 1.0):
+    import pygame
+    from pygame.locals import QUIT, KEYDOWN, K_ESCAPE, K_RIGHT, K_LEFT, K_SPACE, K_BACKSPACE
+    import visualization
+    screen = visualization.setup_screen()
+    shown = set(name for key, name, color in STAGE_KEYS)
+    index = 0
+    world = None
+    loaded = {}
+    while True:
+        filename = filenames[index]
+        if filename not in loaded:
+            loaded = {filename: stagefile.load_whole_stages(filename)}
+        stages = loaded[filename]
+        screen.fill(visualization.white)
+        draw_stages(screen, stages, shown, zoom, world)
+        pygame.display.set_caption("{} ({} of {}): {}{}".format(stages['glyph'], index + 1, len(filenames),
+            stagefile.stage_summary(stages), "" if world is None else ", world {}".format(world + 1)))
+        pygame.display.flip()
+        event = pygame.event.wait()
+        while event.type not in (QUIT, KEYDOWN):
+            event = pygame.event.wait()
+        if event.type == QUIT or event.key == K_ESCAPE or event.unicode == 'q':
+            return
+        elif event.key in (K_RIGHT, K_SPACE):
+            index = (index + 1) % len(filenames)
+            world = None
+        elif event.key in (K_LEFT, K_BACKSPACE):
+            index = (index - 1) % len(filenames)
+            world = None
+        elif event.unicode in ('w', 'W'):
+            # Step through the worlds, with None (all of them) at both ends
+            count = len(stages['widths'])
+            step = 1 if event.unicode == 'w' else -1
+            position = (count if world is None else world) + step
+            position %= count + 1
+            world = None if position == count else position
+        else:
+            for key, name, color in STAGE_KEYS:
+                if event.unicode == key:
+                    shown.symmetric_difference_update([name])
+
+def main():
+    parser = argparse.ArgumentParser(description = "Show the stages of glyphs saved by extractpoints.py --save-stages")
+    parser.add_argument("filenames", nargs = "+", metavar = "FILE", help = "Stages files to show")
+    parser.add_argument('-z', '--zoom', action = "store", type = float, default = 1.0, help = "Zoom level (default 1.0)")
+    parser.add_argument('--summary', action = "store_true", help = "Only print how big each stage of each file is")
+    parser.add_argument('--contact-sheet', action = "store", default = None, metavar = "DIRECTORY", help = "Draw the files into PNG contact sheets in DIRECTORY instead of showing them")
+    args = parser.parse_args()
+    if args.summary:
+        for filename in args.filenames:
+            stages = stagefile.load_whole_stages(filename)
+            print("{}: {}".format(stages['glyph'], stagefile.stage_summary(stages)))
+    elif args.contact_sheet:
+        draw_contact_sheets(args.filenames, args.contact_sheet)
+    else:
+        show_stages(args.filenames, args.zoom)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
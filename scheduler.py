@@ -0,0 +1,98 @@
+from __future__ import division, print_function
+
+"""Library for scheduling glyphs across several worker processes
+
+When glyphs are processed in parallel, the run can't finish before its
+slowest glyph does, so a huge glyph that gets started last keeps every other
+worker idle while it runs. Handing out the most expensive glyphs first
+(largest-processing-time-first scheduling) avoids that. To do so we need a
+cost for each glyph before it has been processed: either the time it took in
+an earlier run, recorded in a stats file, or an estimate from its outline.
+"""
+
+import heapq
+import json
+import os
+import sys
+
+# Rough cost, in seconds, of each feature of an outline. Only their relative
+# sizes matter much: when a stats file from an earlier run is available, the
+# estimates are rescaled to match the times measured in that run.
+COST_PER_GLYPH = 0.01
+COST_PER_CONTOUR = 0.05
+COST_PER_ON_CURVE_POINT = 0.001
+COST_PER_OFF_CURVE_POINT = 0.003  # Curves get subdivided into many segments
+COST_PER_EM_SQUARED = 0.2  # Bounding box area, as a fraction of em * em
+
+def estimate_glyph_cost(glyph, em, depth = 0):
+    """Estimate the seconds needed to process a glyph, from the number of
+    contours and on/off-curve points in its foreground layer and the area of
+    its bounding box. Referenced glyphs count towards the cost, since a
+    worker may have to process them too."""
+    layer = glyph.foreground
+    cost = COST_PER_GLYPH
+    for contour in layer:
+        on_curve = sum(1 for p in contour if p.on_curve)
+        cost += COST_PER_CONTOUR
+        cost += COST_PER_ON_CURVE_POINT * on_curve
+        cost += COST_PER_OFF_CURVE_POINT * (len(contour) - on_curve)
+    if len(layer):
+        xmin, ymin, xmax, ymax = layer.boundingBox()
+        cost += COST_PER_EM_SQUARED * (xmax - xmin) * (ymax - ymin) / float(em * em)
+    if depth < 10:  # Guard against reference loops in broken fonts
+        for ref in glyph.references:
+            cost += estimate_glyph_cost(glyph.font[ref[0]], em, depth + 1)
+    return cost
+
+def estimate_costs(font, glyphnames, measured = None):
+    """Return a dict of glyph name -> estimated seconds. If measured (a dict of
+    glyph name -> seconds from an earlier run) is given, glyphs in it use their
+    measured time, and the other estimates are scaled by the ratio between
+    measured and estimated time over the glyphs that have both."""
+    estimates = dict((name, estimate_glyph_cost(font[name], font.em)) for name in glyphnames)
+    if measured:
+        known = [name for name in glyphnames if name in measured]
+        estimated_total = sum(estimates[name] for name in known)
+        measured_total = sum(measured[name] for name in known)
+        if estimated_total > 0 and measured_total > 0:
+            factor = measured_total / estimated_total
+            for name in estimates:
+                estimates[name] *= factor
+        for name in known:
+            estimates[name] = measured[name]
+    return estimates
+
+def largest_first(costs):
+    """Return the glyph names in costs, most expensive first. Ties are broken
+    by name so the order is the same from run to run."""
+    return sorted(costs, key = lambda name: (-costs[name], name))
+
+def predict_makespan(costs, workers):
+    """Predict the wall-clock time of a run where each of the given number of
+    workers takes the next job (in the order given) as soon as it's free."""
+    finish_times = [0.0] * max(workers, 1)
+    for cost in costs:
+        earliest = heapq.heappop(finish_times)
+        heapq.heappush(finish_times, earliest + cost)
+    return max(finish_times)
+
+def load_glyph_stats(path):
+    """Read per-glyph stats written by save_glyph_stats. Returns a dict of
+    glyph name -> dict of stats, or an empty dict if there are none yet."""
+    if not path or not os.path.exists(path):
+        return {}
+    with open(path) as f:
+        try:
+            data = json.load(f)
+        except ValueError:
+            print("WARNING: Could not read glyph stats from {}".format(path))
+            return {}
+    return data.get('glyphs', {})
+
+def save_glyph_stats(path, glyph_stats):
+    """Write a dict of glyph name -> dict of stats, such as {'seconds': 0.25}"""
+    with open(path, 'w') as f:
+        json.dump({'glyphs': glyph_stats}, f, indent = 1, sort_keys = True)
+
+if __name__ == '__main__':
+    sys.stderr.write('Please run extractpoints.py, not this file.\n')
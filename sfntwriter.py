@@ -0,0 +1,393 @@
+from __future__ import division, print_function
+
+"""Library for writing dotted TrueType fonts without FontForge
+
+FontForge's generate() writes the whole font from scratch, on one thread, and
+for a font of tens of thousands of dots most of that time goes on work that
+simple circles don't need. For TrueType input and output, write_dotted_ttf
+instead copies the tables of the input file as they are, and only rebuilds
+the ones that the new glyphs change:
+
+    glyf, loca   the dotted glyphs, as quadratic circles; other glyphs are copied
+    hmtx, vmtx   side bearings (and advance widths, with keep_bearings)
+    hhea, vhea   the minimum side bearings and the maximum extent
+    maxp         the most points and contours in a glyph
+    head         the font's bounding box, the loca format, the date and checksum
+    name         the family, full and PostScript names
+    OS/2         the average advance width
+
+hdmx, LTSH and VDMX (device metrics of the old outlines) and DSIG (the old
+file's signature) are left out. Fonts that can't be written this way (CFF
+outlines, variable fonts, font collections) raise UnsupportedFont, and the
+caller should fall back to FontForge. Only needs the standard library.
+"""
+
+import math
+import struct
+import sys
+import time
+
+# Tables that only describe the old outlines, and would be wrong for the dots
+DROPPED_TABLES = ('hdmx', 'LTSH', 'VDMX', 'DSIG')
+
+# Tables rebuilt by write_dotted_ttf; the rest are copied as they are
+REBUILT_TABLES = ('glyf', 'loca', 'hmtx', 'vmtx', 'hhea', 'vhea', 'maxp', 'head', 'name', 'OS/2')
+
+# Seconds from 1904-01-01, when font dates start, to 1970-01-01
+EPOCH_1904 = 2082844800
+
+# Point flags in the glyf table
+ON_CURVE = 0x01
+X_SHORT = 0x02
+Y_SHORT = 0x04
+REPEAT = 0x08
+X_SAME_OR_POSITIVE = 0x10
+Y_SAME_OR_POSITIVE = 0x20
+
+# The most points and contours a simple glyph can have: the last point's
+# number and maxp's maxPoints are unsigned 16-bit, numberOfContours signed
+MAX_POINTS = 0xFFFF
+MAX_CONTOURS = 0x7FFF
+
+class UnsupportedFont(Exception):
+    """The font can't be written by this module"""
+
+def read_sfnt(path):
+    """Read the tables of a TrueType or OpenType font file. Returns (sfnt
+    version, dict of table tag -> data)."""
+    with open(path, 'rb') as f:
+        data = f.read()
+    version = data[:4]
+    if version == 'ttcf':
+        raise UnsupportedFont("{} is a font collection".format(path))
+    if version not in ('\x00\x01\x00\x00', 'true', 'OTTO'):
+        raise UnsupportedFont("{} is not a TrueType or OpenType font".format(path))
+    numtables, = struct.unpack('>H', data[4:6])
+    tables = {}
+    for i in range(numtables):
+        tag, checksum, offset, length = struct.unpack('>4sLLL', data[12 + 16 * i:28 + 16 * i])
+        tables[tag] = data[offset:offset + length]
+    return version, tables
+
+def table_checksum(data):
+    data += '\0' * (-len(data) % 4)
+    return sum(struct.unpack('>{}L'.format(len(data) // 4), data)) & 0xFFFFFFFF
+
+def write_sfnt(path, version, tables):
+    """Write a font file from a dict of table tag -> data, filling in the
+    checksum adjustment in the head table"""
+    tags = sorted(tables)
+    power = 1
+    while power * 2 <= len(tags):
+        power *= 2
+    header = struct.pack('>4sHHHH', version, len(tags), power * 16,
+        power.bit_length() - 1, (len(tags) - power) * 16)
+    if 'head' in tables:
+        # The adjustment is calculated with the field itself set to zero
+        tables = dict(tables, head = tables['head'][:8] + '\0\0\0\0' + tables['head'][12:])
+    directory = []
+    body = []
+    offset = 12 + 16 * len(tags)
+    head_offset = None
+    for tag in tags:
+        data = tables[tag]
+        if tag == 'head':
+            head_offset = offset
+        directory.append(struct.pack('>4sLLL', tag, table_checksum(data), offset, len(data)))
+        body.append(data + '\0' * (-len(data) % 4))
+        offset += len(body[-1])
+    font = ''.join([header] + directory + body)
+    if head_offset is not None:
+        adjustment = (0xB1B0AFBA - table_checksum(font)) & 0xFFFFFFFF
+        font = font[:head_offset + 8] + struct.pack('>L', adjustment) + font[head_offset + 12:]
+    with open(path, 'wb') as f:
+        f.write(font)
+
+def split_glyphs(tables):
+    """The data of each glyph in the glyf table, by glyph id"""
+    numglyphs, = struct.unpack('>H', tables['maxp'][4:6])
+    long_offsets, = struct.unpack('>h', tables['head'][50:52])
+    if long_offsets:
+        offsets = struct.unpack('>{}L'.format(numglyphs + 1), tables['loca'][:4 * (numglyphs + 1)])
+    else:
+        offsets = [2 * offset for offset in
+            struct.unpack('>{}H'.format(numglyphs + 1), tables['loca'][:2 * (numglyphs + 1)])]
+    glyf = tables['glyf']
+    return [glyf[offsets[i]:offsets[i + 1]] for i in range(numglyphs)]
+
+def glyph_bounds(data):
+    """(number of contours, xMin, yMin, xMax, yMax) of a glyph's data, or
+    None for an empty glyph. Composite glyphs have -1 contours."""
+    if len(data) < 10:
+        return None
+    return struct.unpack('>hhhhh', data[:10])
+
+def circle_offsets(radius):
+    """The points of a quadratic circle of the given radius, as offsets from
+    its center: eight off-curve points on the octagon around the circle, so
+    that the implied on-curve points between them touch the circle at every
+    45 degrees (including the extremes). Clockwise, as TrueType expects of
+    outer contours."""
+    distance = radius / math.cos(math.pi / 8)
+    angles = [math.pi / 8 - k * math.pi / 4 for k in range(8)]
+    return [(distance * math.cos(angle), distance * math.sin(angle)) for angle in angles]
+
+def encode_glyph(contours):
+    """Encode a simple glyph with no instructions. contours is a list of
+    contours, each a list of (x, y, on_curve) points with integer
+    coordinates. Returns (data, bounds), bounds as from glyph_bounds.
+    Raises UnsupportedFont if there are more points or contours than a
+    TrueType glyph can hold."""
+    if not contours:
+        return '', None
+    points = sum(len(contour) for contour in contours)
+    if points > MAX_POINTS or len(contours) > MAX_CONTOURS:
+        raise UnsupportedFont("{} points in {} contours is more than a TrueType glyph can hold ({} points, {} contours)".format(
+            points, len(contours), MAX_POINTS, MAX_CONTOURS))
+    xs = [x for contour in contours for x, y, on_curve in contour]
+    ys = [y for contour in contours for x, y, on_curve in contour]
+    bounds = (len(contours), min(xs), min(ys), max(xs), max(ys))
+    end_points = []
+    for contour in contours:
+        end_points.append(len(contour) + (end_points[-1] if end_points else -1))
+    flags = []
+    xdata = bytearray()
+    ydata = bytearray()
+    last_x = last_y = 0
+    for contour in contours:
+        for x, y, on_curve in contour:
+            flag = ON_CURVE if on_curve else 0
+            dx, dy = x - last_x, y - last_y
+            last_x, last_y = x, y
+            if dx == 0:
+                flag |= X_SAME_OR_POSITIVE
+            elif -255 <= dx <= 255:
+                flag |= X_SHORT | (X_SAME_OR_POSITIVE if dx > 0 else 0)
+                xdata.append(abs(dx))
+            else:
+                xdata.extend(struct.pack('>h', dx))
+            if dy == 0:
+                flag |= Y_SAME_OR_POSITIVE
+            elif -255 <= dy <= 255:
+                flag |= Y_SHORT | (Y_SAME_OR_POSITIVE if dy > 0 else 0)
+                ydata.append(abs(dy))
+            else:
+                ydata.extend(struct.pack('>h', dy))
+            flags.append(flag)
+    # Runs of the same flag are written once, with a repeat count
+    flagdata = bytearray()
+    i = 0
+    while i < len(flags):
+        run = 1
+        while i + run < len(flags) and flags[i + run] == flags[i] and run < 256:
+            run += 1
+        if run > 2:
+            flagdata.extend((flags[i] | REPEAT, run - 1))
+        else:
+            flagdata.extend(flags[i:i + run])
+        i += run
+    data = (struct.pack('>hhhhh', *bounds) +
+        struct.pack('>{}H'.format(len(end_points)), *end_points) +
+        struct.pack('>H', 0) + str(flagdata) + str(xdata) + str(ydata))
+    return data, bounds
+
+def dot_glyph_data(dots, offsets, shift = 0):
+    """Encode a glyph made of a circle (see circle_offsets) at each dot,
+    moved right by shift. Returns (data, bounds) as encode_glyph does."""
+    contours = [[(int(round(x + shift + dx)), int(round(y + dy)), False) for dx, dy in offsets]
+        for x, y in dots]
+    return encode_glyph(contours)
+
+def read_metrics(data, count, numglyphs):
+    """Read an hmtx or vmtx table as a list of [advance, side bearing]"""
+    metrics = [list(pair) for pair in zip(*[iter(struct.unpack('>' + 'Hh' * count, data[:4 * count]))] * 2)]
+    bearings = struct.unpack('>{}h'.format(numglyphs - count), data[4 * count:4 * count + 2 * (numglyphs - count)])
+    return metrics + [[metrics[-1][0], bearing] for bearing in bearings]
+
+def pack_metrics(metrics):
+    """Write an hmtx or vmtx table. The advances of the glyphs at the end
+    that share the last advance are left out. Returns (data, number of
+    advances written)."""
+    count = len(metrics)
+    while count > 1 and metrics[count - 2][0] == metrics[-1][0]:
+        count -= 1
+    data = (struct.pack('>' + 'Hh' * count, *[value for pair in metrics[:count] for value in pair]) +
+        struct.pack('>{}h'.format(len(metrics) - count), *[bearing for advance, bearing in metrics[count:]]))
+    return data, count
+
+def update_metrics_header(header, metrics, extents):
+    """Update an hhea or vhea table for new metrics. extents is a list of
+    (min, max) of the glyphs' bounds in the table's direction (None for
+    empty glyphs)."""
+    header = bytearray(header)
+    used = [(pair, extent) for pair, extent in zip(metrics, extents) if extent is not None]
+    struct.pack_into('>H', header, 10, max(advance for advance, bearing in metrics))
+    if used:
+        struct.pack_into('>hhh', header, 12,
+            min(bearing for (advance, bearing), extent in used),
+            min(advance - bearing - (high - low) for (advance, bearing), (low, high) in used),
+            max(bearing + high - low for (advance, bearing), (low, high) in used))
+    return header
+
+def encode_name(text, platform, encoding):
+    """Encode a name for a name record, or return None if the record's
+    encoding isn't one we can write"""
+    if platform in (0, 3):
+        return text.encode('utf-16-be')
+    if platform == 1 and encoding == 0:
+        return text.encode('mac_roman', 'replace')
+    return None
+
+def decode_name(data, platform, encoding):
+    if platform in (0, 3):
+        return data.decode('utf-16-be', 'replace')
+    if platform == 1 and encoding == 0:
+        return data.decode('mac_roman', 'replace')
+    return None
+
+def rename_font(data, family, full, postscript):
+    """Set the family, full and PostScript names in a name table. The old
+    PostScript name is replaced with the new one in the unique font name."""
+    form, count, storage = struct.unpack('>HHH', data[:6])
+    if form != 0:
+        raise UnsupportedFont("name table format {} isn't supported".format(form))
+    new_names = {1: family, 4: full, 6: postscript, 16: family}
+    records = []
+    old_postscript = None
+    for i in range(count):
+        platform, encoding, language, nameid, length, offset = struct.unpack('>6H', data[6 + 12 * i:18 + 12 * i])
+        string = data[storage + offset:storage + offset + length]
+        records.append([platform, encoding, language, nameid, string])
+        if nameid == 6 and old_postscript is None:
+            old_postscript = decode_name(string, platform, encoding)
+    for record in records:
+        platform, encoding, language, nameid, string = record
+        if nameid in new_names:
+            text = new_names[nameid]
+        elif nameid == 3 and old_postscript:
+            text = decode_name(string, platform, encoding)
+            text = text.replace(old_postscript, postscript) if text is not None else None
+        else:
+            continue
+        if text is not None:
+            encoded = encode_name(text, platform, encoding)
+            if encoded is not None:
+                record[4] = encoded
+    strings = []
+    offsets = {}
+    position = 0
+    packed = []
+    for platform, encoding, language, nameid, string in records:
+        if string not in offsets:
+            offsets[string] = position
+            strings.append(string)
+            position += len(string)
+        packed.append(struct.pack('>6H', platform, encoding, language, nameid, len(string), offsets[string]))
+    return struct.pack('>HHH', 0, count, 6 + 12 * count) + ''.join(packed) + ''.join(strings)
+
+def as_unicode(name):
+    return name if isinstance(name, unicode) else name.decode('utf-8')
+
+def write_dotted_ttf(source, output, glyphs, radius, names = None, keep_bearings = False, glyph_names = None):
+    """Write a copy of the TrueType font file source to output, with some of
+    its glyphs replaced by dots. glyphs is a dict of glyph id -> list of the
+    (x, y) centers of the glyph's dots, in font units; each dot is a circle of
+    the given radius. names, if given, is (family name, full name, PostScript
+    name) for the new font. With keep_bearings, each dotted glyph is moved and
+    its advance width changed so that it keeps the side bearings of the
+    original (like extractpoints.py -b); otherwise the dots stay where they
+    are and the advance widths don't change. glyph_names, a dict of glyph
+    id -> name, is only used in error messages. Returns the number of dots."""
+    version, tables = read_sfnt(source)
+    if 'glyf' not in tables or 'loca' not in tables:
+        raise UnsupportedFont("{} has no glyf table (it may have CFF outlines)".format(source))
+    if 'gvar' in tables:
+        raise UnsupportedFont("{} is a variable font".format(source))
+    glyph_data = split_glyphs(tables)
+    numglyphs = len(glyph_data)
+    old_bounds = [glyph_bounds(data) for data in glyph_data]
+    hhea = tables['hhea']
+    hmetrics = read_metrics(tables['hmtx'], struct.unpack('>H', hhea[34:36])[0], numglyphs)
+    vmetrics = None
+    if 'vhea' in tables and 'vmtx' in tables:
+        vmetrics = read_metrics(tables['vmtx'], struct.unpack('>H', tables['vhea'][34:36])[0], numglyphs)
+    offsets = circle_offsets(radius)
+    bounds = list(old_bounds)
+    max_points, max_contours = struct.unpack('>HH', tables['maxp'][6:10])
+    total_dots = 0
+    for gid, dots in glyphs.items():
+        if not 0 <= gid < numglyphs:
+            raise UnsupportedFont("{} has no glyph {}".format(source, gid))
+        try:
+            data, new_bounds = dot_glyph_data(dots, offsets)
+        except UnsupportedFont as e:
+            raise UnsupportedFont("glyph {}: {}".format((glyph_names or {}).get(gid, gid), e))
+        old = old_bounds[gid]
+        if keep_bearings and old is not None and new_bounds is not None:
+            advance, old_lsb = hmetrics[gid]
+            shift = old_lsb - new_bounds[1]
+            if shift:
+                data, new_bounds = dot_glyph_data(dots, offsets, shift)
+            hmetrics[gid][0] = max(new_bounds[3] + advance - old_lsb - (old[3] - old[1]), 0)
+        if new_bounds is not None:
+            hmetrics[gid][1] = new_bounds[1]
+            if vmetrics is not None and old is not None:
+                # Keep the vertical origin where it was
+                vmetrics[gid][1] = vmetrics[gid][1] + old[4] - new_bounds[4]
+            max_points = max(max_points, len(dots) * len(offsets))
+            max_contours = max(max_contours, len(dots))
+        glyph_data[gid] = data
+        bounds[gid] = new_bounds
+        total_dots += len(dots)
+    # glyf and loca
+    glyf = []
+    loca = [0]
+    for data in glyph_data:
+        glyf.append(data + '\0' * (-len(data) % 4))
+        loca.append(loca[-1] + len(glyf[-1]))
+    tables['glyf'] = ''.join(glyf)
+    long_offsets = loca[-1] >= 0x20000
+    if long_offsets:
+        tables['loca'] = struct.pack('>{}L'.format(len(loca)), *loca)
+    else:
+        tables['loca'] = struct.pack('>{}H'.format(len(loca)), *[offset // 2 for offset in loca])
+    # Metrics
+    tables['hmtx'], count = pack_metrics(hmetrics)
+    hhea = update_metrics_header(hhea, hmetrics,
+        [(b[1], b[3]) if b is not None else None for b in bounds])
+    struct.pack_into('>H', hhea, 34, count)
+    tables['hhea'] = str(hhea)
+    if vmetrics is not None:
+        tables['vmtx'], count = pack_metrics(vmetrics)
+        vhea = update_metrics_header(tables['vhea'], vmetrics,
+            [(b[2], b[4]) if b is not None else None for b in bounds])
+        struct.pack_into('>H', vhea, 34, count)
+        tables['vhea'] = str(vhea)
+    if 'OS/2' in tables and struct.unpack('>H', tables['OS/2'][:2])[0] >= 3:
+        advances = [advance for advance, bearing in hmetrics if advance]
+        if advances:
+            os2 = bytearray(tables['OS/2'])
+            struct.pack_into('>h', os2, 2, int(round(sum(advances) / len(advances))))
+            tables['OS/2'] = str(os2)
+    # maxp and head
+    if len(tables['maxp']) >= 10:
+        maxp = bytearray(tables['maxp'])
+        struct.pack_into('>HH', maxp, 6, max_points, max_contours)
+        tables['maxp'] = str(maxp)
+    head = bytearray(tables['head'])
+    used = [b for b in bounds if b is not None]
+    if used:
+        struct.pack_into('>hhhh', head, 36, min(b[1] for b in used), min(b[2] for b in used),
+            max(b[3] for b in used), max(b[4] for b in used))
+    struct.pack_into('>q', head, 28, int(time.time()) + EPOCH_1904)
+    struct.pack_into('>h', head, 50, 1 if long_offsets else 0)
+    tables['head'] = str(head)
+    if names is not None and 'name' in tables:
+        tables['name'] = rename_font(tables['name'], *[as_unicode(name) for name in names])
+    for tag in DROPPED_TABLES:
+        tables.pop(tag, None)
+    write_sfnt(output, version, tables)
+    return total_dots
+
+if __name__ == '__main__':
+    sys.stderr.write('Please run extractpoints.py, not this file.\n')
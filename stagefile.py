@@ -0,0 +1,228 @@
+from __future__ import division, print_function
+
+"""Library for saving the stages of a glyph's pipeline to a file, and loading
+them again
+
+With --save-stages DIRECTORY, every glyph that is calculated gets a file of
+its own in DIRECTORY (see stages_path), holding what each stage of the
+pipeline made of it, so that a problem glyph can be looked at again (with
+replay.py) or checked from Python without running FontForge, the
+triangulation or anything else again.
+
+The file is a zip archive. index.json describes the glyph and the settings
+it was made with, and each stage is kept as raw arrays of numbers: a stage is
+a list of lists of ... of numbers, and is stored as all its numbers, one after
+the other (<stage>.values, doubles), plus the length of every list at each
+level but the top one (<stage>.lengths1, <stage>.lengths2, ..., unsigned
+ints), from the outermost in. A list of 3 points, [(0, 0), (1, 0), (1, 1)],
+is values 0 0 1 0 1 1 and lengths1 2 2 2. The lists at the innermost level
+(the points) are loaded as tuples.
+
+Each outside polygon of a glyph, with its holes, is processed on its own (a
+"world"; see extractpoints.process_world), and most stages are lists with an
+entry for each world:
+
+    rings      the flattened outline, then its holes: lists of (x, y)
+    widths     the stroke width found for the polygon (a number)
+    triangles  the triangulation: three (x, y) points each
+    edges      each triangle's edges that aren't on the outline, each two
+               (x, y) points
+    midpoints  the middle of each of those edges, triangle by triangle
+    midlines   the midlines: lists of (x, y)
+
+All of these are in the normalized coordinates the geometry is calculated in
+(see --normalize-em). There's also
+
+    dots       the dots, each (x, y), in font units; index.json has the
+               em_scale that converts them to normalized coordinates
+
+Saving the stages doesn't change how a glyph is calculated, so a file only
+has the worlds that were actually processed for its glyph. index.json says
+where the rest came from:
+
+    components  for a composite whose references' midlines were reused, a
+                list of [glyph name, transformation matrix] (in font units,
+                as FontForge gives it) for each reference
+    copy_of     for an outline whose midlines were copied from an identical
+                one, [glyph name, x offset, y offset] (normalized)
+
+Those glyphs' files are in the same directory; load_whole_stages puts them
+all together.
+"""
+
+import json
+import os
+import sys
+import zipfile
+from array import array
+
+FORMAT = 'fontinline-stages'
+FORMAT_VERSION = 1
+EXTENSION = '.stages'
+
+# How many levels of lists each stage has above its numbers, worlds included
+STAGE_DEPTHS = {
+    'rings': 4,
+    'widths': 1,
+    'triangles': 4,
+    'edges': 5,
+    'midpoints': 4,
+    'midlines': 4,
+    'dots': 2,
+}
+
+# Stages kept for each world, by the key extract_midlines gives them
+WORLD_STAGES = [
+    ('rings', 'rings'),
+    ('widths', 'width'),
+    ('triangles', 'triangles'),
+    ('edges', 'edges'),
+    ('midpoints', 'midpoints'),
+    ('midlines', 'midlines'),
+]
+
+# Unsigned ints of 4 bytes on every platform we run on
+LENGTH_TYPE = 'I'
+
+def stages_path(directory, glyphname):
+    """The file for a glyph's stages. Glyph names that only differ in case
+    (A and a) get different file names even where file names ignore case,
+    by following each capital with an underscore, as UFO file names do."""
+    name = ''.join(c + '_' if c.isupper() else c for c in glyphname)
+    name = ''.join(c if c.isalnum() or c in '._-+' else '_' for c in name)
+    if name.startswith('.'):
+        name = '_' + name[1:]
+    return os.path.join(directory, name + EXTENSION)
+
+def flatten(data, depth):
+    """Flatten lists nested depth levels deep into an array of their numbers
+    and an array of list lengths for each level below the top"""
+    values = array('d')
+    lengths = [array(LENGTH_TYPE) for level in range(depth - 1)]
+    def walk(items, level):
+        if level == depth - 1:
+            values.extend(float(value) for value in items)
+        else:
+            for item in items:
+                item = list(item)
+                lengths[level].append(len(item))
+                walk(item, level + 1)
+    walk(data, 0)
+    return values, lengths
+
+def unflatten(values, lengths):
+    """Rebuild the nested lists from flatten's arrays"""
+    items = list(values)
+    for level, level_lengths in enumerate(reversed(lengths)):
+        # The innermost lists are points, kept as tuples
+        group = tuple if level == 0 else list
+        grouped = []
+        position = 0
+        for length in level_lengths:
+            grouped.append(group(items[position:position + length]))
+            position += length
+        items = grouped
+    return items
+
+def save_stages(path, glyphname, stages, dots, info = None):
+    """Write a glyph's stages, as collected by extractpoints.extract_midlines,
+    and its dots (in font units) to path. info is a dict of anything else to
+    put in index.json, such as the settings and em_scale."""
+    worlds = stages.get('worlds', [])
+    data = dict((name, [world[key] for world in worlds]) for name, key in WORLD_STAGES)
+    data['dots'] = dots
+    index = dict(info or {})
+    index.update({
+        'format': FORMAT,
+        'version': FORMAT_VERSION,
+        'glyph': glyphname,
+        'byteorder': sys.byteorder,
+        'stages': sorted(data),
+    })
+    # Write to a temporary file first, so that a file is never half-written
+    with zipfile.ZipFile(path + '.tmp', 'w', zipfile.ZIP_STORED) as archive:
+        archive.writestr('index.json', json.dumps(index, sort_keys = True, default = repr))
+        for name, nested in data.items():
+            values, lengths = flatten(nested, STAGE_DEPTHS[name])
+            archive.writestr(name + '.values', values.tostring())
+            for level, level_lengths in enumerate(lengths, 1):
+                archive.writestr('{}.lengths{}'.format(name, level), level_lengths.tostring())
+    os.rename(path + '.tmp', path)
+
+def load_stages(path):
+    """Load a file written by save_stages. Returns the dict from index.json,
+    with each stage added to it under its name (see above)."""
+    with zipfile.ZipFile(path) as archive:
+        index = json.loads(archive.read('index.json'))
+        if index.get('format') != FORMAT or index.get('version') != FORMAT_VERSION:
+            raise ValueError("{} isn't a stages file this version can read".format(path))
+        swap = index['byteorder'] != sys.byteorder
+        def read(name, typecode):
+            numbers = array(typecode)
+            numbers.fromstring(archive.read(name))
+            if swap:
+                numbers.byteswap()
+            return numbers
+        result = dict(index)
+        for name in index['stages']:
+            values = read(name + '.values', 'd')
+            lengths = [read('{}.lengths{}'.format(name, level), LENGTH_TYPE) for level in range(1, STAGE_DEPTHS[name])]
+            result[name] = unflatten(values, lengths)
+    return result
+
+def move_points(data, matrix, depth):
+    """Apply a transformation (xx, yy, dx, dy) to the points of lists
+    nested depth levels deep, depth counting the points themselves"""
+    xx, yy, dx, dy = matrix
+    if depth == 1:
+        return (xx * data[0] + dx, yy * data[1] + dy)
+    return [move_points(item, matrix, depth - 1) for item in data]
+
+def load_whole_stages(path):
+    """Load a file written by save_stages, as load_stages does, adding the
+    worlds of the glyphs it refers to (see components and copy_of above),
+    moved into place, so that the result pictures the whole glyph. The dots
+    are the glyph's own, which already include those of its components."""
+    directory = os.path.dirname(path)
+    def load(path, matrix, seen):
+        stages = load_stages(path)
+        if matrix != (1, 1, 0, 0):
+            for name, key in WORLD_STAGES:
+                if name != 'widths':
+                    stages[name] = move_points(stages[name], matrix, STAGE_DEPTHS[name])
+        xx, yy, dx, dy = matrix
+        sources = []
+        if 'copy_of' in stages:
+            glyphname, x, y = stages['copy_of']
+            sources.append((glyphname, (xx, yy, xx * x + dx, yy * y + dy)))
+        for glyphname, (cxx, cxy, cyx, cyy, cdx, cdy) in stages.get('components', []):
+            # The offsets are in font units, scaled as the glyph was before its
+            # midlines were calculated
+            scale = stages['options']['scale'] * stages['em_scale']
+            sources.append((glyphname, (xx * cxx, yy * cyy, xx * cdx * scale + dx, yy * cdy * scale + dy)))
+        for glyphname, source_matrix in sources:
+            source_path = stages_path(directory, glyphname or '')
+            # The source may have been calculated by an earlier run that
+            # didn't save its stages (see extractpoints --resume)
+            if glyphname is None or glyphname in seen or not os.path.exists(source_path):
+                continue
+            source = load(source_path, source_matrix, seen | set([glyphname]))
+            for name, key in WORLD_STAGES:
+                stages[name] = stages[name] + source[name]
+        return stages
+    stages = load_stages(path)
+    return load(path, (1, 1, 0, 0), set([stages['glyph']]))
+
+def stage_summary(stages):
+    """One line saying how big each stage of loaded stages is"""
+    def count(name, depth = 1):
+        items = stages.get(name, [])
+        for level in range(depth):
+            items = [item for group in items for item in group]
+        return len(items)
+    return ("{} worlds, {} rings, {} triangles, {} edges, {} midlines, {} dots".format(
+        len(stages.get('widths', [])), count('rings'), count('triangles'), count('edges', 2),
+        count('midlines'), len(stages.get('dots', []))))
+
+if __name__ == '__main__':
+    sys.stderr.write('Please run extractpoints.py or replay.py, not this file.\n')
@@ -0,0 +1,159 @@
+from __future__ import division, print_function
+
+"""Library for writing the dotted glyphs of a UFO font
+
+A UFO keeps each glyph in a .glif file of its own, so the dotted glyphs can
+be written by several processes at once, and a rebuild only needs to rewrite
+the glyphs whose dots have changed. The rest of the UFO (font info, kerning,
+features, the glyphs' advance widths, code points and anchors) is written
+once by FontForge with the dotted glyphs left empty; see
+extractpoints.write_ufo. write_dotted_glyphs then fills in their outlines.
+
+What was written is recorded in a manifest in the UFO's data directory:
+
+    {"version": 1, "source": [...settings the rest of the UFO was made with...],
+     "glyphs": {glyphname: key, ...}}
+
+where each key is a hash of everything the glyph's .glif file was made from,
+so that a glyph whose key hasn't changed doesn't need writing again.
+"""
+
+import hashlib
+import json
+import os
+import plistlib
+import sys
+import xml.etree.cElementTree as ElementTree
+import multiprocessing
+
+MANIFEST_VERSION = 1
+MANIFEST_NAME = os.path.join('data', 'org.sil.fontinline.manifest.json')
+
+# Distance of the control points of a quarter circle of radius 1 from its ends
+KAPPA = 0.5522847498
+
+def load_manifest(ufo, source):
+    """Return the glyph keys recorded in the UFO's manifest, or None if there
+    isn't one, or if it was written for a different source"""
+    try:
+        with open(os.path.join(ufo, MANIFEST_NAME)) as f:
+            manifest = json.load(f)
+    except (IOError, ValueError):
+        return None
+    # Round-trip through JSON so that tuples and lists compare equal
+    if (manifest.get('version') != MANIFEST_VERSION or
+            manifest.get('source') != json.loads(json.dumps(source))):
+        return None
+    return manifest.get('glyphs', {})
+
+def save_manifest(ufo, source, keys):
+    path = os.path.join(ufo, MANIFEST_NAME)
+    if not os.path.isdir(os.path.dirname(path)):
+        os.makedirs(os.path.dirname(path))
+    with open(path + '.tmp', 'w') as f:
+        json.dump({'version': MANIFEST_VERSION, 'source': source, 'glyphs': keys}, f, sort_keys = True)
+    os.rename(path + '.tmp', path)
+
+def glyph_key(dots, radius, width, shift):
+    """Hash of everything that goes into a dotted glyph's outline"""
+    return hashlib.sha1(repr((radius, width, shift, dots))).hexdigest()
+
+def glif_filenames(ufo):
+    """The .glif file of each glyph, by glyph name, from glyphs/contents.plist"""
+    contents = plistlib.readPlist(os.path.join(ufo, 'glyphs', 'contents.plist'))
+    return dict((name, os.path.join(ufo, 'glyphs', filename)) for name, filename in contents.items())
+
+def number(value):
+    """A coordinate as written in a .glif file"""
+    text = '{:.2f}'.format(value).rstrip('0').rstrip('.')
+    return '0' if text == '-0' else text
+
+def circle_points(x, y, radius):
+    """The points of a cubic circle centered on (x, y), counter-clockwise, as
+    (x, y, type) with type None for off-curve points"""
+    k = KAPPA * radius
+    offsets = [
+        (radius, 0, 'curve'), (radius, k, None), (k, radius, None),
+        (0, radius, 'curve'), (-k, radius, None), (-radius, k, None),
+        (-radius, 0, 'curve'), (-radius, -k, None), (-k, -radius, None),
+        (0, -radius, 'curve'), (k, -radius, None), (radius, -k, None),
+    ]
+    return [(x + dx, y + dy, kind) for dx, dy, kind in offsets]
+
+def dotted_glif(text, dots, radius, width = None, shift = 0):
+    """Replace the outline in the text of a .glif file with a circle of the
+    given radius at each dot, moved right by shift, and set its advance width
+    if width isn't None. Everything else in the file is kept."""
+    glyph = ElementTree.fromstring(text)
+    for old in glyph.findall('outline'):
+        glyph.remove(old)
+    outline = ElementTree.Element('outline')
+    for dot_x, dot_y in dots:
+        contour = ElementTree.SubElement(outline, 'contour')
+        for x, y, kind in circle_points(dot_x + shift, dot_y, radius):
+            point = ElementTree.SubElement(contour, 'point', x = number(x), y = number(y))
+            if kind is not None:
+                point.set('type', kind)
+    # The outline comes before the lib, if there is one
+    children = list(glyph)
+    position = len(children)
+    for i, child in enumerate(children):
+        if child.tag == 'lib':
+            position = i
+            break
+    glyph.insert(position, outline)
+    if width is not None:
+        advance = glyph.find('advance')
+        if advance is None:
+            advance = ElementTree.Element('advance')
+            glyph.insert(0, advance)
+        advance.set('width', number(width))
+    return ElementTree.tostring(glyph, encoding = 'UTF-8')
+
+def write_glif(task):
+    path, dots, radius, width, shift = task
+    with open(path) as f:
+        text = f.read()
+    text = dotted_glif(text, dots, radius, width, shift)
+    with open(path + '.tmp', 'w') as f:
+        f.write(text)
+    os.rename(path + '.tmp', path)
+
+def write_dotted_glyphs(ufo, source, glyphs, radius, processes = 1):
+    """Write the outlines of the dotted glyphs into a UFO. glyphs is a dict of
+    glyph name -> (dots, width, shift): width is the new advance width, or
+    None to keep the one in the .glif file, and each dot is moved right by
+    shift. Only glyphs that have changed since the UFO's manifest was written
+    for the same source are written, by the given number of processes (most
+    of the time goes on parsing and writing XML, so threads would mostly wait
+    for each other). Returns the number of glyphs written."""
+    keys = load_manifest(ufo, source) or {}
+    filenames = glif_filenames(ufo)
+    tasks = []
+    new_keys = {}
+    for glyphname, (dots, width, shift) in glyphs.items():
+        key = glyph_key(dots, radius, width, shift)
+        new_keys[glyphname] = key
+        if keys.get(glyphname) != key or not os.path.exists(filenames[glyphname]):
+            tasks.append((filenames[glyphname], dots, radius, width, shift))
+    if tasks:
+        # Forget the old manifest until the new one is written, so that an
+        # interrupted run doesn't leave half-written glyphs marked as done
+        manifest = os.path.join(ufo, MANIFEST_NAME)
+        if os.path.exists(manifest):
+            os.remove(manifest)
+        if processes <= 1 or len(tasks) == 1:
+            map(write_glif, tasks)
+        else:
+            pool = multiprocessing.Pool(processes)
+            try:
+                pool.map(write_glif, tasks)
+                pool.close()
+            finally:
+                pool.terminate()
+                pool.join()
+    save_manifest(ufo, source, new_keys)
+    return len(tasks)
+
+if __name__ == '__main__':
+    sys.stderr.write('Please run extractpoints.py, not this file.\n')
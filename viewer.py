@@ -0,0 +1,257 @@
+#!/usr/bin/env python
+
+from __future__ import division, print_function
+
+"""Interactive viewer for tuning the dot settings
+
+Shows a glyph's outline, triangles, midlines and dots, and lets the settings
+be changed with keys while watching the result:
+
+    r / R        smaller / bigger dots (radius)
+    s / S        closer / further apart dots (spacing)
+    m / M        lower / raise the minimum stroke width (-m)
+    x / X        lower / raise the maximum stroke width (-M)
+    Right, Space next glyph
+    Left, Backsp previous glyph
+    t l d g      show or hide the triangles, midlines, dots or outline
+    q, Escape    quit
+
+Run it with the same arguments as extractpoints.py, e.g.
+
+    python viewer.py Padauk.ttf U+1000 -r 12 -s 6.0 --text "abc"
+
+The glyphs are the --text/--unicodes/--glyphs subset, or the whole font,
+starting at the glyph given (if any). Each glyph's outline, triangles and
+midlines are calculated once for each pair of stroke widths, on a thread of
+its own, and the glyphs either side of the one shown are calculated ahead of
+time. The radius and spacing only affect the dots, which are placed on the
+midlines again straight away. On quitting, the extractpoints.py options for
+the last settings are printed.
+"""
+
+import sys
+import collections
+import threading
+import traceback
+import pygame
+from pygame.locals import QUIT, KEYDOWN, K_ESCAPE, K_RIGHT, K_LEFT, K_SPACE, K_BACKSPACE
+import extractpoints
+import visualization
+from visualization import red, green, blue, black, white
+
+# How many glyphs after the current one (and before it) to calculate ahead
+PREFETCH = 2
+
+# Stroke widths (in font units) above this count as no maximum
+UNLIMITED = 1e99
+
+# How many glyphs' stages to keep, dropping the least recently shown first
+MAX_CACHED = 100
+
+class StageCache(object):
+    """Calculates the stages (see extractpoints.extract_midlines) of glyphs
+    for given stroke widths, one at a time on a thread of its own, and keeps
+    them. want() gives the list of (glyph name, minimum stroke width, maximum
+    stroke width) keys to calculate, most wanted first; get() returns the
+    stages for a key, or None if they aren't ready yet. A glyph that can't
+    be calculated gets {'error': message} instead of its stages. Only the
+    MAX_CACHED most recently used results are kept. FontForge isn't
+    thread-safe, so only this thread uses the font once it has started."""
+    def __init__(self, font, options):
+        self.font = font
+        self.options = options
+        self.results = collections.OrderedDict()
+        self.wanted = []
+        self.condition = threading.Condition()
+        thread = threading.Thread(target = self.run)
+        thread.daemon = True
+        thread.start()
+
+    def want(self, keys):
+        with self.condition:
+            self.wanted = [key for key in keys if key not in self.results]
+            self.condition.notify()
+
+    def get(self, key):
+        with self.condition:
+            result = self.results.pop(key, None)
+            if result is not None:
+                self.results[key] = result
+            return result
+
+    def run(self):
+        while True:
+            with self.condition:
+                while not self.wanted:
+                    self.condition.wait()
+                key = self.wanted.pop(0)
+                if key in self.results:
+                    continue
+            try:
+                result = self.calculate(*key)
+            except Exception as e:
+                # Keep going with the other glyphs; draw() shows the error
+                traceback.print_exc()
+                result = {'error': "{}: {}".format(e.__class__.__name__, e)}
+            with self.condition:
+                self.results[key] = result
+                while len(self.results) > MAX_CACHED:
+                    self.results.popitem(last = False)
+
+    def calculate(self, glyphname, minstrokewidth, maxstrokewidth):
+        options = self.options._replace(minstrokewidth = minstrokewidth, maxstrokewidth = maxstrokewidth)
+        context = extractpoints.RunContext(options, self.font.em)
+        stages = {}
+        stages['font_midlines'] = extractpoints.glyph_midlines(self.font[glyphname], context, {}, stages = stages, whole = True)
+        stages['em_scale'] = context.em_scale
+        stages['geometry_em'] = context.geometry_em
+        return stages
+
+class Viewer(object):
+    """The viewer's window and settings"""
+    def __init__(self, font, glyphnames, options, start = 0):
+        # Only the StageCache's thread uses the font from here on
+        self.em = font.em
+        self.glyphnames = glyphnames
+        self.options = options
+        self.index = start
+        self.cache = StageCache(font, options)
+        self.screen = visualization.setup_screen()
+        try:
+            pygame.font.init()
+            self.text_font = pygame.font.Font(None, 20)
+        except (pygame.error, ImportError, NotImplementedError):
+            self.text_font = None
+        # The dots last placed, and what they were placed for
+        self.dots_key = None
+        self.dots = []
+
+    def key(self, index = None):
+        glyphname = self.glyphnames[(self.index if index is None else index) % len(self.glyphnames)]
+        return (glyphname, self.options.minstrokewidth, self.options.maxstrokewidth)
+
+    def request(self):
+        """Ask for the current glyph's stages, then the glyphs around it"""
+        keys = [self.key()]
+        for step in range(1, PREFETCH + 1):
+            keys.extend([self.key(self.index + step), self.key(self.index - step)])
+        self.cache.want(keys)
+
+    def handle(self, event):
+        """Apply a key press. Returns False to quit."""
+        options = self.options
+        char = event.unicode
+        if event.key in (K_ESCAPE,) or char == 'q':
+            return False
+        elif event.key in (K_RIGHT, K_SPACE):
+            self.index = (self.index + 1) % len(self.glyphnames)
+        elif event.key in (K_LEFT, K_BACKSPACE):
+            self.index = (self.index - 1) % len(self.glyphnames)
+        elif char in ('r', 'R'):
+            options = options._replace(radius = options.radius * (1.1 if char == 'R' else 1 / 1.1))
+        elif char in ('s', 'S'):
+            options = options._replace(spacing = max(options.spacing + (0.25 if char == 'S' else -0.25), 0.25))
+        elif char in ('m', 'M'):
+            options = options._replace(minstrokewidth = max(options.minstrokewidth * (1.25 if char == 'M' else 0.8), 1.0))
+        elif char in ('x', 'X'):
+            if options.maxstrokewidth >= UNLIMITED:
+                # Start from the em size, which is more than any stroke
+                maxstrokewidth = self.em if char == 'x' else options.maxstrokewidth
+            else:
+                maxstrokewidth = options.maxstrokewidth * (1.25 if char == 'X' else 0.8)
+                if maxstrokewidth > self.em:
+                    maxstrokewidth = 1e100
+            options = options._replace(maxstrokewidth = maxstrokewidth)
+        elif char in ('t', 'l', 'd', 'g'):
+            name = {'t': 'show_triangles', 'l': 'show_lines', 'd': 'show_dots', 'g': 'show_glyph'}[char]
+            options = options._replace(**{name: not getattr(options, name)})
+        self.options = options
+        return True
+
+    def draw(self):
+        """Draw the current glyph, if its stages are ready, and flip the
+        screen once"""
+        options = self.options
+        key = self.key()
+        stages = self.cache.get(key)
+        screen = self.screen
+        screen.fill(white)
+        lines = ["{} ({} of {})".format(key[0], self.index % len(self.glyphnames) + 1, len(self.glyphnames))]
+        if stages is None:
+            lines.append("Calculating...")
+        elif 'error' in stages:
+            lines.append("Failed: " + stages['error'])
+        else:
+            dots_key = (key, options.radius, options.spacing, options.prune_distance)
+            if dots_key != self.dots_key:
+                self.dots = extractpoints.dots_on_midlines(stages['font_midlines'], options)
+                self.dots_key = dots_key
+            em = stages['geometry_em']
+            scale = stages['em_scale']
+            # Fit 1.5 em on the screen, with room for descenders
+            zoom = options.zoom * screen.get_size()[1] / (1.5 * em)
+            emsize = 1.25 * em
+            if options.show_triangles or options.show_glyph:
+                visualization.draw_all(screen, stages['outlines'], [], stages['triangles'], emsize, zoom,
+                    polylinecolor = (blue if options.show_glyph else None),
+                    trianglecolor = (red if options.show_triangles else None), update = False)
+            if options.show_lines:
+                visualization.draw_midlines(screen, stages['midlines'], emsize, zoom, polylinecolor = green, update = False)
+            if options.show_dots:
+                visualization.draw_dots(screen, [(x * scale, y * scale) for x, y in self.dots], emsize, zoom,
+                    options.radius * scale, color = blue, update = False)
+            lines.append("{} dots".format(len(self.dots)))
+        lines.append("-r {:.2f}  -s {:.2f}  -m {:.1f}  -M {}".format(options.radius, options.spacing, options.minstrokewidth,
+            "{:.1f}".format(options.maxstrokewidth) if options.maxstrokewidth < UNLIMITED else "(none)"))
+        if self.text_font is not None:
+            for i, line in enumerate(lines):
+                screen.blit(self.text_font.render(line, True, black), (10, 10 + 20 * i))
+        pygame.display.set_caption(" - ".join(lines))
+        pygame.display.flip()
+
+    def run(self):
+        clock = pygame.time.Clock()
+        drawn = None
+        while True:
+            for event in pygame.event.get():
+                if event.type == QUIT:
+                    return
+                if event.type == KEYDOWN and not self.handle(event):
+                    return
+            self.request()
+            # Only draw again when something has changed
+            state = (self.index, self.options, self.cache.get(self.key()) is not None)
+            if state != drawn:
+                self.draw()
+                drawn = state
+            clock.tick(60)
+
+def main():
+    args = extractpoints.parse_args()
+    if args.inputfilename is None:
+        return 2
+    options = extractpoints.Options.from_args(args)
+    if not options.visualize:
+        options = options._replace(show_triangles = True, show_lines = True, show_dots = True, show_glyph = True)
+    font = extractpoints.silent_fontopen(args.inputfilename)
+    subset = extractpoints.select_glyphs(font, options.text, options.unicodes, options.glyphs)
+    glyphnames = [glyphname for glyphname in font
+        if glyphname not in ('.notdef', '.null') and (subset is None or glyphname in subset)]
+    if not glyphnames:
+        print("No glyphs to show")
+        return 1
+    start = 0
+    if args.glyphname is not None:
+        spec = args.glyphname
+        glyph = font[int(spec[2:], 16)] if spec.startswith('U+') else font[spec]
+        if glyph.glyphname in glyphnames:
+            start = glyphnames.index(glyph.glyphname)
+    viewer = Viewer(font, glyphnames, options, start)
+    viewer.run()
+    options = viewer.options
+    print("Last settings: -r {} -s {} -m {}{}".format(options.radius, options.spacing, options.minstrokewidth,
+        " -M {}".format(options.maxstrokewidth) if options.maxstrokewidth < UNLIMITED else ""))
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -2,17 +2,23 @@ from __future__ import division, print_function
 
 """Library for visualizing our results"""
 
+import os
+import sys
 import pygame
 import itertools
 import time
 from pygame.locals import QUIT, KEYDOWN, MOUSEBUTTONDOWN
-from pygame.gfxdraw import trigon, line, pixel, filled_circle
-from generalfuncs import pairwise, ux, uy
+from generalfuncs import ux, uy
 from dataconvert import get_triangle_point
 
 red = pygame.Color(255, 0, 0)
 green = pygame.Color(0, 255, 0)
 blue = pygame.Color(0, 128, 255)
+white = pygame.Color(255, 255, 255)
+black = pygame.Color(0, 0, 0)
+gray = pygame.Color(150, 150, 150)
+pink = pygame.Color(255, 200, 200)
+dark_green = pygame.Color(0, 160, 0)
 
 def setup_screen():
     SCREEN_SIZE = (1280, 800)
@@ -41,99 +47,171 @@ def wait_for_keypress(emsize = 1024, zoom = 1.0):
             sys.stdout.flush()
             continue
 
-def flip_polyline(polylinelist, emsize):
-    """This function takes a list of lists of tuples (the list of polylines), and inverts the y coordinate of each point
-    because the coordinate systems for fontforge are different than the coordinate systems for the p2t program."""
-    # Used for visualization only
-    result = []
-    for point in polylinelist:
-        #for point in polyline:
-            try:
-                x, y = point.x, emsize-point.y
-                result.append(point.__class__(x, y))
-            except AttributeError:
-                x, y = point[0], emsize-point[1]
-                result.append(tuple([x, y]))
-    return result
+def to_screen(points, emsize = 1024, zoom = 1.0, origin = (0, 0)):
+    """Convert a list of points in glyph coordinates to screen coordinates
+    (flipping the y axis, which points down on the screen), all at once.
+    origin is where the top left corner (x = 0, y = emsize) goes."""
+    left, top = origin
+    return [(int(left + ux(p) * zoom), int(top + (emsize - uy(p)) * zoom)) for p in points]
+
+def show(rects):
+    """Update the part of the screen that was drawn on (a list of the
+    rectangles returned by the draw functions), in one go"""
+    if rects:
+        pygame.display.update(rects[0].unionall(rects[1:]))
+
+# The draw functions below draw everything they're given, and then update the
+# screen once, unless update is False; either way, they return the rectangles
+# that they drew on, so that a caller drawing several things can update the
+# screen once at the end with show().
 
 def draw_fat_point(screen, point, emsize = 1024, zoom = 1.0, radius = 4, color = red):
-    x = int(ux(point) * zoom)
-    y = int((emsize-uy(point)) * zoom)
-    # Radius given in em units; convert to screen units
-    screen_height = screen.get_size()[1]
-    pixel_radius = radius * screen_height / float(emsize)
-    filled_circle(screen, x, y, int(pixel_radius), color)
-
-def draw_all(screen, polylines, holes, triangles, emsize = 1024, zoom = 1.0, polylinecolor = green, holecolor = blue, trianglecolor = red):
-    """This function takes the list of polylines and holes and the triangulation, and draws it in pygame.
-    This function is pending deprecation."""
-    global args
+    return draw_dots(screen, [point], emsize, zoom, radius, color, update = False)[0]
+
+def draw_dots(screen, dots, emsize = 1024, zoom = 1.0, radius = 4, color = red, update = True):
+    # Radius given in em units, which are zoomed like the dots' positions
+    pixel_radius = max(int(radius * zoom), 1)
+    rects = [pygame.draw.circle(screen, color, center, pixel_radius) for center in to_screen(dots, emsize, zoom)]
+    if update:
+        show(rects)
+    return rects
 
+def draw_all(screen, polylines, holes, triangles, emsize = 1024, zoom = 1.0, polylinecolor = green, holecolor = blue, trianglecolor = red, update = True):
+    """This function takes the list of polylines and holes and the triangulation, and draws it in pygame."""
+    rects = []
     if trianglecolor is not None:
         for t in triangles:
-            a = get_triangle_point(t, 0)
-            b = get_triangle_point(t, 1)
-            c = get_triangle_point(t, 2)
-            x1 = int(ux(a) * zoom)
-            y1 = int((emsize-uy(a)) * zoom)
-            x2 = int(ux(b) * zoom)
-            y2 = int((emsize-uy(b)) * zoom)
-            x3 = int(ux(c) * zoom)
-            y3 = int((emsize-uy(c)) * zoom)
-            trigon(screen, x1, y1, x2, y2, x3, y3, trianglecolor)
-
-    # Close the polylines loop again prior to drawing
-    if polylinecolor is not None:
-        for polyline in polylines:
-            if hasattr(polyline, 'coords'):
-                polyline = list(polyline.coords)
-            polyline.append(polyline[0])
-            flipped = flip_polyline(polyline, emsize)
-            for a, b in pairwise(flipped):
-                x1 = int(a[0] * zoom)
-                y1 = int(a[1] * zoom)
-                x2 = int(b[0] * zoom)
-                y2 = int(b[1] * zoom)
-                line(screen, x1, y1, x2, y2, polylinecolor)
-
-    # Same for holes
-    if holecolor is not None:
-        for hole in holes:
-            if hasattr(hole, 'coords'):
-                hole = list(hole.coords)
-            hole.append(hole[0])
-            flipped = flip_polyline(hole, emsize)
-            for a, b in pairwise(flipped):
-                x1 = int(a[0] * zoom)
-                y1 = int(a[1] * zoom)
-                x2 = int(b[0] * zoom)
-                y2 = int(b[1] * zoom)
-                line(screen, x1, y1, x2, y2, holecolor)
-
-    # Show result
-    pygame.display.update()
-
-def draw_midlines(screen, polylines, midpoints, emsize = 1024, zoom = 1.0, polylinecolor = green, midpointcolor = red):
-    """This function takes the list of polylines and midpoints, and draws them in pygame."""
-    global args
-    #for m in midpoints:
-        #x = int(m[0] * zoom)
-        #y = int((emsize-m[1]) * zoom)
-        #print((x, y))
-        #pixel(screen, x, y, midpointcolor)
-
-    # Close the polylines loop again prior to drawing
+            points = to_screen([get_triangle_point(t, 0), get_triangle_point(t, 1), get_triangle_point(t, 2)], emsize, zoom)
+            rects.append(pygame.draw.polygon(screen, trianglecolor, points, 1))
+    # The polylines and holes are closed loops
+    for rings, color in ((polylines, polylinecolor), (holes, holecolor)):
+        if color is None:
+            continue
+        for ring in rings:
+            if hasattr(ring, 'coords'):
+                ring = ring.coords
+            points = to_screen(ring, emsize, zoom)
+            if len(points) > 1:
+                rects.append(pygame.draw.lines(screen, color, True, points))
+    if update:
+        show(rects)
+    return rects
+
+def draw_midlines(screen, polylines, emsize = 1024, zoom = 1.0, polylinecolor = green, update = True):
+    """This function takes the list of midlines, and draws them in pygame."""
+    rects = []
     for polyline in polylines:
-        #polyline.append(polyline[0])
-        flipped = flip_polyline(polyline, emsize)
-        for a, b in pairwise(flipped):
-            x1 = int(a[0] * zoom)
-            y1 = int(a[1] * zoom)
-            x2 = int(b[0] * zoom)
-            y2 = int(b[1] * zoom)
-            line(screen, x1, y1, x2, y2, polylinecolor)
-            pygame.display.update()
-    # Show result
+        points = to_screen(polyline, emsize, zoom)
+        if len(points) > 1:
+            rects.append(pygame.draw.lines(screen, polylinecolor, False, points))
+    if update:
+        show(rects)
+    return rects
+
+class ContactSheets(object):
+    """Draws glyphs small, in a grid of cells, and saves each page as a PNG
+    file (contact-001.png, contact-002.png, ...) in directory once it's full.
+    Each cell shows a glyph's outline, triangles, midlines and dots, as
+    collected by extractpoints.extract_midlines (see draw_contact_sheets
+    there), in normalized coordinates with the given em size. Nothing is
+    shown on screen, so this works without a display.
+
+    Each polyline is drawn with one call, after converting all its points to
+    cell coordinates at once, and the dots are stamped from one circle drawn
+    beforehand, all in one call where pygame has Surface.blits. (pygame has
+    no call for many separate lines, so each triangle is still a call of its
+    own.) seconds is the total time spent drawing and saving."""
+    margin = 4
+    label_height = 14
+
+    def __init__(self, directory, emsize, columns = 12, rows = 10, cell_size = 160):
+        # No window is ever opened, but some SDL builds want a video driver
+        os.environ.setdefault('SDL_VIDEODRIVER', 'dummy')
+        self.directory = directory
+        self.emsize = emsize
+        self.columns = columns
+        self.rows = rows
+        self.cell_size = cell_size
+        self.surface = pygame.Surface((columns * cell_size, rows * cell_size))
+        self.surface.fill(white)
+        try:
+            pygame.font.init()
+            self.font = pygame.font.Font(None, self.label_height + 2)
+        except (pygame.error, ImportError, NotImplementedError):
+            # Without SDL_ttf, the cells just go without their labels
+            self.font = None
+        # A dot to stamp for each radius (in pixels)
+        self.dot_images = {}
+        self.count = 0
+        self.pages = 0
+        self.seconds = 0.0
+        # The cells show from 0.3 em below the baseline to 1 em above it
+        area = cell_size - 2 * self.margin - self.label_height
+        self.scale = area / (1.3 * emsize)
+
+    def add(self, glyphname, stages):
+        """Draw a glyph into the next cell. stages is a dict that may hold
+        'outlines' and 'midlines' (lists of lists of (x, y)), 'triangles'
+        (a list of three (x, y) tuples each), 'dots' (a list of (x, y)) and
+        'radius' (of the dots)."""
+        start = time.time()
+        index = self.count % (self.columns * self.rows)
+        left = (index % self.columns) * self.cell_size
+        top = (index // self.columns) * self.cell_size
+        scale = self.scale
+        origin = (left + self.margin + 0.15 * self.emsize * scale, top + self.margin + self.label_height)
+        def to_cell(points):
+            return to_screen(points, self.emsize, scale, origin)
+        surface = self.surface
+        surface.set_clip(pygame.Rect(left, top, self.cell_size, self.cell_size))
+        for triangle in stages.get('triangles', []):
+            pygame.draw.polygon(surface, pink, to_cell(triangle), 1)
+        for outline in stages.get('outlines', []):
+            points = to_cell(outline)
+            if len(points) > 1:
+                pygame.draw.lines(surface, gray, True, points)
+        for midline in stages.get('midlines', []):
+            points = to_cell(midline)
+            if len(points) > 1:
+                pygame.draw.lines(surface, dark_green, False, points)
+        radius = max(int(stages.get('radius', 0) * scale), 1)
+        image = self.dot_image(radius)
+        stamps = [(image, (x - radius, y - radius)) for x, y in to_cell(stages.get('dots', []))]
+        if hasattr(surface, 'blits'):
+            surface.blits(stamps, False)
+        else:
+            for stamp in stamps:
+                surface.blit(*stamp)
+        pygame.draw.rect(surface, gray, pygame.Rect(left, top, self.cell_size, self.cell_size), 1)
+        if self.font is not None:
+            surface.blit(self.font.render(glyphname, True, black), (left + self.margin, top + 2))
+        surface.set_clip(None)
+        self.count += 1
+        if self.count % (self.columns * self.rows) == 0:
+            self.save()
+        self.seconds += time.time() - start
+
+    def dot_image(self, radius):
+        image = self.dot_images.get(radius)
+        if image is None:
+            image = pygame.Surface((2 * radius + 1, 2 * radius + 1))
+            image.fill(white)
+            image.set_colorkey(white)
+            pygame.draw.circle(image, blue, (radius, radius), radius)
+            self.dot_images[radius] = image
+        return image
+
+    def save(self):
+        self.pages += 1
+        pygame.image.save(self.surface, os.path.join(self.directory, 'contact-{:03d}.png'.format(self.pages)))
+        self.surface.fill(white)
+
+    def close(self):
+        """Save the last page, if it has anything on it"""
+        if self.count % (self.columns * self.rows):
+            start = time.time()
+            self.save()
+            self.seconds += time.time() - start
 
 if __name__ == '__main__':
     sys.stderr.write('Please run extractpoints.py, not this file.\n')